@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+per-residue CPU latency of the BepiPred-3.0 path in eager vs compiled mode.
+
+    PYTHONPATH=. python benchmarks/bp3_compiled_benchmark.py [--lengths 100 400 1000] [--repeats 20] [--esm]
+
+the fold ensemble is benchmarked with the real BP3 weights when BP3Models is initialized,
+otherwise with randomly initialized folds (same architecture, same cost). --esm also
+benchmarks the ESM-2 forward, which needs the esm2_t33_650M_UR50D weights.
+"""
+
+import argparse
+import tempfile
+import time
+import torch
+
+from immunogenicity.utils.bp3 import bepipred3 as bp3
+from immunogenicity.utils.bp3.compiled import trace_fold_ensemble, compile_fold_ensemble, compile_esm2_model
+from immunogenicity.utils.bp3.esm_registry import get_esm2_model
+
+
+def load_fold_ensemble():
+    model_states = sorted((bp3.MODELS_PATH / "BP3C50IDFFNN").glob("*Fold*"))
+    if model_states:
+        fold_state_dicts = [torch.load(model_state, map_location="cpu") for model_state in model_states]
+    else:
+        print("BP3Models not initialized, benchmarking randomly initialized folds")
+        fold_state_dicts = [bp3.MyDenseNet().state_dict() for _ in range(5)]
+    return bp3.BP3FoldEnsemble(bp3.MyDenseNet(), fold_state_dicts).eval()
+
+
+def time_per_residue(fn, x, num_residues, repeats):
+    with torch.no_grad():
+        #warm up, also triggers the torch.compile compilation
+        for _ in range(3):
+            fn(x)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn(x)
+    return (time.perf_counter() - start) / repeats / num_residues
+
+
+def benchmark_heads(lengths, repeats):
+    ensemble = load_fold_ensemble()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        modes = {"eager": ensemble.predict_probs,
+                 "torchscript": trace_fold_ensemble(ensemble, f"{tmp_dir}/traced.pt").predict_probs,
+                 "torch_compile": compile_fold_ensemble(ensemble).predict_probs}
+        print("BP3 fold ensemble, microseconds per residue")
+        for seq_len in lengths:
+            x = torch.randn(1, seq_len, ensemble.esm_embedding_size)
+            timings = {mode: time_per_residue(fn, x, seq_len, repeats) * 1e6 for mode, fn in modes.items()}
+            print(f"L={seq_len:5d} " + " ".join(f"{mode}={t:8.3f}" for mode, t in timings.items()))
+
+
+def benchmark_esm(lengths, repeats):
+    model, alphabet = get_esm2_model()
+    batch_converter = alphabet.get_batch_converter()
+    modes = {"eager": lambda tokens: model(tokens, repr_layers=[33]),
+             "torch_compile": (lambda compiled: lambda tokens: compiled(tokens, repr_layers=[33]))(compile_esm2_model(model))}
+    print("ESM-2 forward, milliseconds per residue")
+    for seq_len in lengths:
+        _, _, tokens = batch_converter([("bench", "A" * seq_len)])
+        timings = {mode: time_per_residue(fn, tokens, seq_len, repeats) * 1e3 for mode, fn in modes.items()}
+        print(f"L={seq_len:5d} " + " ".join(f"{mode}={t:8.3f}" for mode, t in timings.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 400, 1000])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--esm", action="store_true")
+    args = parser.parse_args()
+
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} threads")
+    benchmark_heads(args.lengths, args.repeats)
+    if args.esm:
+        benchmark_esm(args.lengths, max(1, args.repeats // 10))
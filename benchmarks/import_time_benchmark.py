@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+cold import time of every public module, each measured in a fresh interpreter.
+
+    PYTHONPATH=. python benchmarks/import_time_benchmark.py [--repeats 5] [--modules physiochemical.protparam ...]
+
+prints the median wall time of `import <module>` and which heavy dependencies the import
+dragged in. a module that fails to import (e.g. missing optional artifacts) is reported
+with its error instead.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+PUBLIC_MODULES = ["immunogenicity.predict_b_cell_epitope",
+                  "immunogenicity.predict_c1_immunogenicity",
+                  "immunogenicity.predict_mhc_1_binding",
+                  "immunogenicity.predict_mhc_2_binding",
+                  "immunogenicity.utils.pdb_to_sequence",
+                  "immunogenicity.utils.pdb_to_fasta",
+                  "immunogenicity.utils.bp3.bepipred3",
+                  "physiochemical.protparam"]
+
+HEAVY_DEPENDENCIES = ["torch", "esm", "plotly", "pandas", "Bio", "scipy"]
+
+#runs in the child interpreter, prints seconds and the heavy modules that got loaded
+PROBE = """
+import sys, time
+start = time.perf_counter()
+try:
+    import {module}
+    error = ""
+except Exception as e:
+    error = type(e).__name__ + ": " + str(e)
+elapsed = time.perf_counter() - start
+loaded = [dep for dep in {heavy!r} if dep in sys.modules]
+print(repr((elapsed, loaded, error)))
+"""
+
+
+def time_import(module, repeats):
+    timings = list()
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+                             capture_output=True, text=True, check=True).stdout
+        #the module may print on import, the probe's result is the last line
+        elapsed, loaded, error = eval(out.strip().splitlines()[-1])
+        if error:
+            return None, loaded, error
+        timings.append(elapsed)
+    return statistics.median(timings), loaded, ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=PUBLIC_MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':45s} {'import (ms)':>12s}  heavy dependencies loaded")
+    for module in args.modules:
+        median, loaded, error = time_import(module, args.repeats)
+        if error:
+            print(f"{module:45s} {'failed':>12s}  {error}")
+        else:
+            print(f"{module:45s} {median*1000:12.1f}  {', '.join(loaded) or '-'}")
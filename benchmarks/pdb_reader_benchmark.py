@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+time to get the one letter sequence of a PDB with the streaming pdb_reader vs Bio.PDB.PDBParser
+(what pdb_to_sequence used before) and SeqIO's 'pdb-atom' parser (what protparam used before).
+
+    PYTHONPATH=. python benchmarks/pdb_reader_benchmark.py [--lengths 100 400 1000] [--chains 1 2] [--repeats 20] [pdb files ...]
+
+without pdb files, synthetic designs with full heavy atom backbones (N, CA, C, O, CB) are
+written to a temporary directory. the sequences of all three readers are checked against each
+other before timing.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import warnings
+
+from Bio import PDB, SeqIO
+
+from immunogenicity.utils.pdb_reader import THREE_TO_ONE, read_chain_sequences, read_sequence
+
+ONE_TO_THREE = {one: three for three, one in THREE_TO_ONE.items()}
+
+
+def write_design(path, length, chains, seed=0):
+    rng = random.Random(seed)
+    serial = 1
+    lines = list()
+    for chain_id in "ABCDEFGH"[:chains]:
+        for resseq in range(1, length + 1):
+            resname = ONE_TO_THREE[rng.choice("ACDEFGHIKLMNPQRSTVWY")]
+            for atom, element in [("N", "N"), ("CA", "C"), ("C", "C"), ("O", "O"), ("CB", "C")]:
+                lines.append("ATOM  %5d  %-3s %3s %s%4d    %8.3f%8.3f%8.3f  1.00  0.00           %s"
+                             % (serial, atom, resname, chain_id, resseq, 3.8 * resseq, serial % 7, 0.0, element))
+                serial += 1
+        lines.append("TER")
+    lines.append("END")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def pdbparser_sequence(pdb_file):
+    structure = PDB.PDBParser(QUIET=True).get_structure("seq_to_struct", pdb_file)
+    return "".join(PDB.Polypeptide.index_to_one(PDB.Polypeptide.three_to_index(residue.get_resname()))
+                   for model in structure for chain in model for residue in chain if PDB.is_aa(residue))
+
+
+def seqio_sequence(pdb_file):
+    return "".join(str(record.seq) for record in SeqIO.parse(pdb_file, "pdb-atom"))
+
+
+def time_reader(fn, pdb_file, repeats):
+    timings = list()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(pdb_file)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdb_files", nargs="*")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 400, 1000])
+    parser.add_argument("--chains", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    #SeqIO warns about every synthetic file's missing HEADER
+    warnings.simplefilter("ignore")
+
+    readers = {"pdb_reader": read_sequence,
+               "first_model": lambda pdb_file: "".join(chain.sequence for chain in read_chain_sequences(pdb_file)),
+               "PDBParser": pdbparser_sequence,
+               "SeqIO": seqio_sequence}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdb_files = list(args.pdb_files)
+        if not pdb_files:
+            for length in args.lengths:
+                for chains in args.chains:
+                    pdb_file = os.path.join(tmp_dir, f"design_L{length}_c{chains}.pdb")
+                    write_design(pdb_file, length, chains)
+                    pdb_files.append(pdb_file)
+
+        print("median milliseconds per file")
+        print(f"{'file':30s} " + " ".join(f"{name:>12s}" for name in readers) + f" {'speedup':>8s}")
+        for pdb_file in pdb_files:
+            sequences = {name: fn(pdb_file) for name, fn in readers.items()}
+            if sequences["pdb_reader"] != sequences["PDBParser"]:
+                raise SystemExit(f"pdb_reader and PDBParser disagree on {pdb_file}")
+            timings = {name: time_reader(fn, pdb_file, args.repeats) for name, fn in readers.items()}
+            print(f"{os.path.basename(pdb_file)[:30]:30s} " + " ".join(f"{t*1000:12.3f}" for t in timings.values())
+                  + f" {timings['PDBParser'] / timings['pdb_reader']:8.1f}x")
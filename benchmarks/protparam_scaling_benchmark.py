@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+wall time of protparam.eval on a synthetic design library for 1, 2, 4, ... processes up to
+the node's core count.
+
+    PYTHONPATH=. python benchmarks/protparam_scaling_benchmark.py [--designs 2000] [--length 200] [--jobs 1 2 4] [--repeats 3]
+
+the designs are written as minimal backbone-only PDBs into a temporary run directory, the
+same layout eval reads (designability_eval/designs/*.pdb). every run's csv is checked against
+the single process one, so the row order is deterministic across job counts.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import warnings
+
+from Bio.SeqUtils import seq3
+
+import physiochemical.protparam as protparam
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def write_design(path, seq):
+    lines = list()
+    for i, aa in enumerate(seq):
+        x = 3.8 * i
+        lines.append("ATOM  %5d  CA  %3s A%4d    %8.3f%8.3f%8.3f  1.00  0.00           C" % (i + 1, seq3(aa).upper(), i + 1, x, 0.0, 0.0))
+    lines.append("END")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def make_library(run_dir, designs, length, seed=0):
+    rng = random.Random(seed)
+    design_dir = os.path.join(run_dir, "designability_eval", "designs")
+    os.makedirs(design_dir)
+    os.makedirs(os.path.join(run_dir, "functional_eval"))
+    for i in range(designs):
+        write_design(os.path.join(design_dir, f"design_{i}.pdb"), "".join(rng.choice(AMINO_ACIDS) for _ in range(length)))
+
+
+def job_counts(max_jobs):
+    counts = [1]
+    while counts[-1] * 2 <= max_jobs:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != max_jobs:
+        counts.append(max_jobs)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--designs", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=200)
+    parser.add_argument("--jobs", type=int, nargs="+", default=job_counts(protparam.available_cores()))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    #SeqIO warns about the missing HEADER of every synthetic design
+    warnings.simplefilter("ignore")
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        make_library(run_dir, args.designs, args.length)
+        out_csv = os.path.join(run_dir, "functional_eval", "protparam.csv")
+
+        print(f"{args.designs} designs of length {args.length}, {protparam.available_cores()} cores available")
+        print(f"{'jobs':>5s} {'time (s)':>10s} {'speedup':>8s} {'designs/s':>10s}")
+        reference = None
+        baseline = None
+        for jobs in args.jobs:
+            timings = list()
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                protparam.eval(run_dir, [7.4], jobs=jobs)
+                timings.append(time.perf_counter() - start)
+            with open(out_csv, "rb") as f:
+                csv = f.read()
+            if reference is None:
+                reference = csv
+            elif csv != reference:
+                raise SystemExit(f"protparam.csv with jobs={jobs} differs from the jobs={args.jobs[0]} one")
+
+            median = statistics.median(timings)
+            baseline = baseline or median
+            print(f"{jobs:5d} {median:10.3f} {baseline / median:8.2f} {args.designs / median:10.1f}")
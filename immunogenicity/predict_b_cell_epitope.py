@@ -1,11 +1,7 @@
-import glob
-import os, sys
-from optparse import OptionParser
-import pandas as pd
-import numpy as np
+import os
 import pathlib
-from collections import namedtuple
-import shutil
+import time
+import math
 
 
 """
@@ -18,22 +14,121 @@ local imports
 env imports
 """
 from immunogenicity.utils.pdb_to_sequence import pdb_to_sequence as p2s
-from immunogenicity.utils.bp3 import bepipred3 as bp3
+from immunogenicity.utils.design_registry import design_chunks
+#the bp3 modules pull in torch, they are imported by the functions that need them so importing this module stays cheap
 
-def eval_b_cell_epitope(results_dir, window_size=10): 
+#designs per group with batch_designs=True, a group's embeddings are all in memory until it has been scored
+DEFAULT_DESIGN_GROUP_SIZE = 100
+
+def eval_b_cell_epitope(results_dir, window_size=10, release_esm_model=False, batch_designs=False, esm_batch_size=10,
+                        persist_embeddings=False, esm_cache_dir=None, esm_cache_max_bytes=50 * 1024**3,
+                        esm_window_size=None, esm_window_overlap=128, precision="fp32", esm_max_tokens=None,
+                        jobs=1, num_threads=None, compile_mode=None, pipeline=False, designs=None, chunk_size=10000): 
     """
     this wrapper around bepipred 3.0 calls a random forest model to predict the probability that a given sequence
     will be recognized as a b cell antigen. 
     ref: https://pubmed.ncbi.nlm.nih.gov/36366745/
+
+    the ESM-2 model is loaded once and reused for every design. it stays loaded after the call
+    so later directories can reuse it, pass release_esm_model=True to free it at the end.
+
+    with batch_designs=True the designs are taken in groups of up to DEFAULT_DESIGN_GROUP_SIZE
+    (or batch_designs=<max designs per group>), each group is encoded in ESM-2 batches of
+    esm_batch_size and scored and written out to one bepipred3_<design>.csv per design before
+    the next group is encoded. setting esm_max_tokens instead groups designs of similar length
+    under a padded token budget.
+
+    ESM-2 embeddings stay in memory unless persist_embeddings=True, in which case they are kept
+    under the bepipred3 output directory.
+
+    with esm_cache_dir set, ESM-2 embeddings are looked up in (and added to) a persistent cache
+    shared across runs, capped at esm_cache_max_bytes.
+
+    designs longer than esm_window_size residues are encoded as overlapping windows and stitched
+    back together, so long constructs get scores for every residue.
+
+    precision="bf16" or "int8" trades a small score drift for CPU throughput, run
+    utils/bp3/precision_report.py on a reference set to see how much.
+
+    jobs > 1 loads ESM-2 once in this process and forks jobs workers that share its weights,
+    each running num_threads torch threads (default: cores split evenly between workers).
+
+    compile_mode="torchscript" traces the BP3 fold ensemble once and caches it on disk,
+    "torch_compile" compiles the ensemble and ESM-2 with torch.compile.
+
+    pipeline=True with jobs > 1 splits the stages instead: this process runs ESM-2 over groups
+    of esm_batch_size designs and jobs workers score the embeddings, which they read straight
+    from shared memory, while the next group is encoded.
+
+    results_dir can also be a DesignRegistry, then its already parsed sequences are used.
+    designs reads the design PDBs from another directory or a tar/zip archive instead of
+    results_dir/designability_eval/designs, or takes sequences straight from a multi-FASTA or
+    a csv/parquet table with id and sequence columns. tables are streamed and evaluated
+    chunk_size sequences at a time.
     """
-    files =  glob.glob(os.path.join(results_dir, 'designability_eval', 'designs', '*.pdb'))
+    from immunogenicity.utils.bp3 import esm_registry
+    from immunogenicity.utils.bp3.esm_cache import ESMEmbeddingCache
+    from immunogenicity.utils.bp3.worker_pool import run_with_shared_esm
+    from immunogenicity.utils.bp3.shm_transport import run_two_stage_pipeline
+
+    results_dir, chunks = design_chunks(results_dir, designs, chunk_size)
     save_dir = os.path.join(results_dir, 'functional_eval', 'bepipred3')
 
     if not os.path.exists(save_dir): 
         os.makedirs(save_dir)
     
-    for PDBFile in files:
-        predict_b_cell_epitope(PDBFile, save_dir, window_size=window_size)
+    esm_cache = None
+    if esm_cache_dir is not None:
+        esm_cache = ESMEmbeddingCache(esm_cache_dir, esm_registry.esm2_model_id(), max_bytes=esm_cache_max_bytes)
+
+    predict_kwargs = dict(window_size=window_size, persist_embeddings=persist_embeddings, esm_cache=esm_cache,
+                          esm_window_size=esm_window_size, esm_window_overlap=esm_window_overlap, precision=precision,
+                          compile_mode=compile_mode)
+    if batch_designs:
+        predict_fn = predict_designs
+        predict_kwargs.update(esm_batch_size=esm_batch_size, esm_max_tokens=esm_max_tokens)
+    else:
+        predict_fn = predict_design
+    encode_kwargs = dict(esm_batch_size=esm_batch_size, esm_max_tokens=esm_max_tokens, persist_embeddings=persist_embeddings,
+                         esm_cache=esm_cache, esm_window_size=esm_window_size, esm_window_overlap=esm_window_overlap,
+                         precision=precision, compile_mode=compile_mode)
+
+    start = time.perf_counter()
+    #the registry keeps load times for the whole process, only what this call loads is reported
+    load_time_before = esm_registry.esm2_load_time() or 0.0
+    num_designs = 0
+    for designs in chunks:
+        num_designs += len(designs)
+        if batch_designs:
+            #contiguous groups of designs, spread over the workers but never more than the group cap
+            max_group_size = DEFAULT_DESIGN_GROUP_SIZE if batch_designs is True else int(batch_designs)
+            group_size = max(1, min(max_group_size, math.ceil(len(designs) / jobs)))
+            tasks = [designs[i:i + group_size] for i in range(0, len(designs), group_size)]
+        else:
+            tasks = designs
+
+        if pipeline and jobs > 1 and len(designs) > 1:
+            run_two_stage_pipeline(lambda: encode_designs(designs, save_dir, **encode_kwargs), score_design_encoding, jobs,
+                                   consume_kwargs=dict(save_dir=save_dir, window_size=window_size, precision=precision, compile_mode=compile_mode),
+                                   num_threads=num_threads)
+        elif jobs > 1 and len(tasks) > 1:
+            run_with_shared_esm(predict_fn, tasks, min(jobs, len(tasks)), fn_kwargs=dict(save_dir=save_dir, **predict_kwargs),
+                                precision=precision, num_threads=num_threads)
+        else:
+            for task in tasks:
+                predict_fn(task, save_dir, **predict_kwargs)
+
+    if num_designs:
+        elapsed = time.perf_counter() - start
+        load_time = (esm_registry.esm2_load_time() or 0.0) - load_time_before
+        load_note = f"ESM-2 load {load_time:.2f}s" if load_time > 0 else "ESM-2 already loaded"
+        print(f"BepiPred-3.0 evaluated {num_designs} designs in {elapsed:.2f}s ({elapsed / num_designs:.2f}s per design, {load_note})")
+
+    if esm_cache is not None:
+        print(f"ESM-2 embedding cache stats: {esm_cache.stats()}")
+
+    if release_esm_model:
+        esm_registry.release_esm2_model()
         
 
 
@@ -41,22 +136,106 @@ def extract_pdb_fname(pdb_path):
     retval, _ = os.path.splitext(os.path.basename(pdb_path))
     return retval
 
-def predict_b_cell_epitope(pdb_fpath, save_dir, window_size=10):
+def predict_b_cell_epitope(pdb_fpath, save_dir, **kwargs):
+    """
+    predict_b_cell_epitope_sequence on the sequence of one PDB, named after the file
+    """
+    return predict_b_cell_epitope_sequence(p2s(pdb_fpath), extract_pdb_fname(pdb_fpath), save_dir, **kwargs)
+
+def predict_design(design, save_dir, **kwargs):
+    """
+    predict_b_cell_epitope_sequence on a DesignRegistry design
+    """
+    return predict_b_cell_epitope_sequence(design.sequence, design.name, save_dir, **kwargs)
+
+def predict_b_cell_epitope_sequence(aa_seq, design_name, save_dir, window_size=10, persist_embeddings=False, esm_cache=None,
+                                    esm_window_size=None, esm_window_overlap=128, precision="fp32", compile_mode=None):
+    """
+    embeddings are passed to the ensemble in memory. with persist_embeddings=True they are
+    also written to esm_encodings_<design> in save_dir and kept there.
+    """
+    from immunogenicity.utils.bp3 import bepipred3 as bp3
 
-    design_name = extract_pdb_fname(pdb_fpath)
-    aa_seq = p2s(pdb_fpath)
-    esm_temp_dir = os.path.join(save_dir, f"esm_encodings_{design_name}")
+    esm_dir = pathlib.Path(save_dir) / f"esm_encodings_{design_name}"
     
-    #generates esm embeddings in dir which gets deleted later...might be better way to do this
-    antigens = bp3.Antigens(aa_seq,pathlib.Path(esm_temp_dir), design_name)
+    antigens = bp3.Antigens(aa_seq, esm_dir, design_name, persist_embeddings=persist_embeddings, esm_cache=esm_cache,
+                            esm_window_size=esm_window_size, esm_window_overlap=esm_window_overlap,
+                            precision=precision, compile_mode=compile_mode)
     #prediction object
-    bp3_predict = bp3.BP3EnsemblePredict(antigens, window_size)
+    bp3_predict = bp3.BP3EnsemblePredict(antigens, window_size, precision=precision, compile_mode=compile_mode)
     #do prediction
     bp3_predict.run_bp3_ensemble()
     #log results
     bp3_predict.create_csvfile(pathlib.Path(save_dir), design_name)
-    ##cleanup, remove esm embeddings dir
-    shutil.rmtree(esm_temp_dir)
+
+    return 
+
+def predict_b_cell_epitopes(pdb_fpaths, save_dir, **kwargs):
+    """
+    predict_b_cell_epitopes_sequences on the sequences of several PDBs, named after the files
+    """
+    return predict_b_cell_epitopes_sequences([p2s(pdb_fpath) for pdb_fpath in pdb_fpaths],
+                                             [extract_pdb_fname(pdb_fpath) for pdb_fpath in pdb_fpaths], save_dir, **kwargs)
+
+def predict_designs(designs, save_dir, **kwargs):
+    """
+    predict_b_cell_epitopes_sequences on a group of DesignRegistry designs
+    """
+    return predict_b_cell_epitopes_sequences([design.sequence for design in designs], [design.name for design in designs],
+                                             save_dir, **kwargs)
+
+def predict_b_cell_epitopes_sequences(aa_seqs, design_names, save_dir, window_size=10, esm_batch_size=10, persist_embeddings=False,
+                                      esm_cache=None, esm_window_size=None, esm_window_overlap=128, precision="fp32",
+                                      esm_max_tokens=None, compile_mode=None):
+    """
+    scores several designs with one Antigens object so ESM-2 sees real multi-sequence
+    batches, then fans the results back out to one csv per design.
+    """
+    from immunogenicity.utils.bp3 import bepipred3 as bp3
+    esm_dir = pathlib.Path(save_dir) / "esm_encodings_batch"
+
+    antigens = bp3.Antigens(aa_seqs, esm_dir, design_names, esm_batch_size=esm_batch_size, esm_max_tokens=esm_max_tokens,
+                            persist_embeddings=persist_embeddings, esm_cache=esm_cache,
+                            esm_window_size=esm_window_size, esm_window_overlap=esm_window_overlap,
+                            precision=precision, compile_mode=compile_mode)
+    bp3_predict = bp3.BP3EnsemblePredict(antigens, window_size, precision=precision, compile_mode=compile_mode)
+    bp3_predict.run_bp3_ensemble()
+    bp3_predict.create_csvfiles(pathlib.Path(save_dir))
+
+    return 
+
+def encode_designs(designs, save_dir, esm_batch_size=10, esm_max_tokens=None, persist_embeddings=False, esm_cache=None,
+                   esm_window_size=None, esm_window_overlap=128, precision="fp32", compile_mode=None):
+    """
+    first stage of the pipelined evaluation: ESM-2 encodes the DesignRegistry designs
+    esm_batch_size at a time and yields (encoding, (design_name, sequence)) for every design.
+    """
+    from immunogenicity.utils.bp3 import bepipred3 as bp3
+    for i in range(0, len(designs), esm_batch_size):
+        group = designs[i:i + esm_batch_size]
+        design_names = [design.name for design in group]
+        aa_seqs = [design.sequence for design in group]
+        esm_dir = pathlib.Path(save_dir) / "esm_encodings_batch"
+
+        antigens = bp3.Antigens(aa_seqs, esm_dir, design_names, esm_batch_size=esm_batch_size, esm_max_tokens=esm_max_tokens,
+                                persist_embeddings=persist_embeddings, esm_cache=esm_cache,
+                                esm_window_size=esm_window_size, esm_window_overlap=esm_window_overlap,
+                                precision=precision, compile_mode=compile_mode)
+        for idx in range(len(group)):
+            yield antigens.get_esm_encoding(idx), (design_names[idx], aa_seqs[idx])
+
+def score_design_encoding(esm_encoding, design, save_dir, window_size=10, precision="fp32", compile_mode=None):
+    """
+    second stage of the pipelined evaluation: runs the BP3 ensemble on an encoding handed
+    over by encode_designs and writes bepipred3_<design>.csv
+    """
+    from immunogenicity.utils.bp3 import bepipred3 as bp3
+    design_name, aa_seq = design
+    antigens = bp3.Antigens(aa_seq, None, design_name, precision=precision, compile_mode=compile_mode,
+                            precomputed_encodings=[esm_encoding])
+    bp3_predict = bp3.BP3EnsemblePredict(antigens, window_size, precision=precision, compile_mode=compile_mode)
+    bp3_predict.run_bp3_ensemble()
+    bp3_predict.create_csvfile(pathlib.Path(save_dir), design_name)
 
     return 
 
@@ -1,24 +1,28 @@
-import glob
 import os, sys
 from optparse import OptionParser
-import pandas as pd
 from immunogenicity.utils import pdb_to_sequence as p2s
+from immunogenicity.utils.design_registry import design_chunks
 
 
 import argparse
-from Bio import PDB
 
 
-def eval_immunogenicity(results_dir, c_allele="HLA-A0101", c_window_size=9, custom_mask=None): 
-    files =  glob.glob(os.path.join(results_dir, 'designability_eval', 'designs', '*.pdb'))
+def eval_immunogenicity(results_dir, c_allele="HLA-A0101", c_window_size=9, custom_mask=None, designs=None, chunk_size=10000): 
+    """
+    results_dir can also be a DesignRegistry, then its already parsed sequences are used.
+    designs reads the design PDBs from another directory or a tar/zip archive instead of
+    results_dir/designability_eval/designs, or takes sequences straight from a multi-FASTA or
+    a csv/parquet table with id and sequence columns, streamed chunk_size at a time
+    """
+    results_dir, chunks = design_chunks(results_dir, designs, chunk_size)
     save_dir = os.path.join(results_dir, 'functional_eval', 'c1_immunogenicity')
 
     if not os.path.exists(save_dir): 
         os.makedirs(save_dir)
     
-    for PDBFile in files:
-        design_name = os.path.splitext(os.path.basename(PDBFile))[0]
-        immungenicity_scores = predict_c1_immunogenicity(PDBFile, c_allele, c_window_size, custom_mask)
+    for design in (design for chunk in chunks for design in chunk):
+        design_name = design.name
+        immungenicity_scores = predict_c1_immunogenicity_sequence(design.sequence, c_allele, c_window_size, custom_mask)
         immungenicity_scores.to_csv(os.path.join(save_dir, f"c1_immunogenicity_{design_name}.csv"))
     
 def sliding_window_string(s, k, mask_arr):
@@ -46,10 +50,16 @@ def predict_c1_immunogenicity(pdb_fpath, c_allele="HLA-A0101", c_window_size=9,
     a higher score indicates a higher probability of the pMHC to be immunogenic, scores are from -1 to 1
     """
 
+    return predict_c1_immunogenicity_sequence(p2s.pdb_to_sequence(pdb_fpath), c_allele, c_window_size, custom_mask)
+
+def predict_c1_immunogenicity_sequence(aa_seq, c_allele="HLA-A0101", c_window_size=9, custom_mask=None): 
+    """
+    predict_c1_immunogenicity on an already extracted amino acid sequence
+    """
+
     if(custom_mask): 
         raise RuntimeError("still a work in progress, we default the masking of the 1, 2, and c-terminus positions")
     
-    aa_seq = p2s.pdb_to_sequence(pdb_fpath)
     parsed_seq = sliding_window_string(aa_seq, c_window_size, custom_mask).split()
 
     pred = Prediction()
@@ -195,6 +205,9 @@ class Prediction():
 
         result_list = [(pep, l, immuno_score, str(allele)) for (pep, l, immuno_score) in result_list[1::]] #also output allele of binder
 
+        #pandas is imported on first use to keep the module cheap to import
+        import pandas as pd
+
         out_df = pd.DataFrame(result_list, 
                               columns=["peptide", "length", "score", "allele"]
         )
@@ -1,4 +1,3 @@
-import glob
 import os, sys
 from optparse import OptionParser
 import pandas as pd
@@ -18,21 +17,28 @@ imports via env
 """
 from immunogenicity.utils import pdb_to_fasta as p2f
 from immunogenicity.utils import pdb_to_sequence as p2s
+from immunogenicity.utils.design_registry import design_chunks
 from immunogenicity.utils.mhcii_42.mhcii_netmhciipan_4_2.mhcii_netmhciipan_4_2_el_percentile_data import percentile_manager as mhcii_netmhciipan_42_el_percentile_manager
 from immunogenicity.utils.mhcii_42.netmhciipan_4_2_executable.netmhciipan_4_2_executable import single_prediction as single_prediction_netmhciipan42
 
 
 
-def eval_mhc2_binding(results_dir, window_size=15, allele_name="DRB1*01:01"): 
-    files =  glob.glob(os.path.join(results_dir, 'designability_eval', 'designs', '*.pdb'))
+def eval_mhc2_binding(results_dir, window_size=15, allele_name="DRB1*01:01", designs=None, chunk_size=10000): 
+    """
+    results_dir can also be a DesignRegistry, then its already parsed sequences are used.
+    designs reads the design PDBs from another directory or a tar/zip archive instead of
+    results_dir/designability_eval/designs, or takes sequences straight from a multi-FASTA or
+    a csv/parquet table with id and sequence columns, streamed chunk_size at a time
+    """
+    results_dir, chunks = design_chunks(results_dir, designs, chunk_size)
     save_dir = os.path.join(results_dir, 'functional_eval', 'netmhc2pan')
 
     if not os.path.exists(save_dir): 
         os.makedirs(save_dir)
     
-    for PDBFile in files:
-        design_name = os.path.splitext(os.path.basename(PDBFile))[0]
-        mhc2_pred = predict_mhc_2_binding(PDBFile, window_size, allele_name)
+    for design in (design for chunk in chunks for design in chunk):
+        design_name = design.name
+        mhc2_pred = predict_mhc_2_binding_sequence(design.sequence, window_size, allele_name)
         mhc2_pred.to_csv(os.path.join(save_dir, f"mhc2_binding_{design_name}.csv"))
                                                  
 def do_netmhciipan_42_el_prediction(sequence_list, allele_length_pairs, coreseq_len=9):
@@ -76,6 +82,12 @@ def do_netmhciipan_42_el_prediction(sequence_list, allele_length_pairs, coreseq_
 def predict_mhc_2_binding(pdb_file, window_size=15, allele_name="DRB1*01:01"): 
     
     seq = p2s.pdb_to_sequence(pdb_file) 
+    return predict_mhc_2_binding_sequence(seq, window_size, allele_name)
+
+def predict_mhc_2_binding_sequence(seq, window_size=15, allele_name="DRB1*01:01"): 
+    """
+    predict_mhc_2_binding on an already extracted amino acid sequence
+    """
     parsed_allele=allele_name
     pair = tuple((parsed_allele, window_size))
     return do_netmhciipan_42_el_prediction(seq, pair)
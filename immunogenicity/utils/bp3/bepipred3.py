@@ -3,28 +3,49 @@ import math
 import subprocess
 import numpy as np
 import torch
-import esm
 import csv
 import torch.nn as nn
 from pathlib import Path
 import sys
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import pandas as pd
+import time
+from collections import namedtuple
+#esm, plotly and pandas are imported where they are used, they are slow to import and most callers never need them
+
+from immunogenicity.utils.bp3.esm_registry import get_esm2_model
+from immunogenicity.utils.bp3.precision import check_precision, inference_context, quantize_linear_layers
+from immunogenicity.utils.bp3 import postprocess
+from immunogenicity.utils.bp3 import compact_plots
+from immunogenicity.utils.bp3.compiled import check_compile_mode, weights_checksum, trace_fold_ensemble, compile_fold_ensemble
+from immunogenicity.utils.bp3 import weight_bundle
 
 ### STATIC PATHS ###
 ROOT_DIR = Path( Path(__file__).parent.resolve() )
 MODELS_PATH = ROOT_DIR / "BP3Models"
 #ESM_SCRIPT_PATH = ROOT_DIR / "extract.py"
 
+CSV_HEADER = "Accession,Residue,BepiPred-3.0 score,BepiPred-3.0 linear epitope score"
+
+#per fold classification thresholds of each model directory
+CLASSIFICATION_THRESHOLDS = {"BP3C50IDSeqLenFFNN": {'Fold1': 0.21326530612244898,
+                                                    'Fold2': 0.15510204081632653,
+                                                    'Fold3': 0.1163265306122449,
+                                                    'Fold4': 0.09693877551020408,
+                                                    'Fold5': 0.19387755102040816},
+                             "BP3C50IDFFNN": {'Fold1': 0.2326530612244898,
+                                              'Fold2': 0.15510204081632653,
+                                              'Fold3': 0.1163265306122449,
+                                              'Fold4': 0.15510204081632653,
+                                              'Fold5': 0.19387755102040816}}
+
 ### SET GPU OR CPU ###
-if torch.cuda.is_available():
-    device = torch.device("cuda")
-    print(f"GPU device detected: {device}")
-else:
-    device = torch.device("cpu")
-    print(f"GPU device not detected. Using CPU: {device}")
+def detect_device():
+    if torch.cuda.is_available():
+        device = torch.device("cuda")
+        print(f"GPU device detected: {device}")
+    else:
+        device = torch.device("cpu")
+        print(f"GPU device not detected. Using CPU: {device}")
+    return device
 
 ### MODEL ###
 
@@ -108,26 +129,180 @@ class MyDenseNet(nn.Module):
         output = self.ff_model(output)                                               
         return output
 
+class BP3FoldEnsemble(nn.Module):
+    """
+    all BP3 fold models stacked into one module. the weights of every fold are loaded
+    once, the first Linear layer runs as a single matmul over the concatenated fold weights
+    and the remaining layers as batched matmuls over the fold axis, so one forward pass
+    gives the epitope probabilities of every fold.
+    """
+    def __init__(self, model_architecture, fold_state_dicts):
+        super(BP3FoldEnsemble, self).__init__()
+
+        self.esm_embedding_size = model_architecture.esm_embedding_size
+        self.num_of_folds = len(fold_state_dicts)
+        linear_idxs = [i for i, layer in enumerate(model_architecture.ff_model) if isinstance(layer, nn.Linear)]
+
+        weights = list()
+        biases = list()
+        for i in linear_idxs:
+            weights.append(torch.stack([sd[f"ff_model.{i}.weight"] for sd in fold_state_dicts]))
+            biases.append(torch.stack([sd[f"ff_model.{i}.bias"] for sd in fold_state_dicts]))
+
+        #first layer: (F*fc1, E) so every fold shares one matmul over the input. kept as an
+        #nn.Linear so dynamic int8 quantization can pick it up
+        self.fc1_size = weights[0].size(1)
+        self.fc_in = nn.Linear(self.esm_embedding_size, self.num_of_folds*self.fc1_size)
+        with torch.no_grad():
+            self.fc_in.weight.copy_(weights[0].reshape(-1, self.esm_embedding_size))
+            self.fc_in.bias.copy_(biases[0].reshape(-1))
+        self.fc_in.requires_grad_(False)
+        #later layers: (F, in, out) for torch.baddbmm
+        self.hidden_weights = nn.ParameterList([nn.Parameter(w.transpose(1, 2).contiguous(), requires_grad=False) for w in weights[1:]])
+        self.hidden_biases = nn.ParameterList([nn.Parameter(b.unsqueeze(1), requires_grad=False) for b in biases[1:]])
+
+    def forward(self, antigen):
+        batch_size = antigen.size(0)
+        seq_len = antigen.size(1)
+        #convert dim (N, L, esm_embedding) --> (N*L, esm_embedding)
+        output = torch.reshape(antigen, (batch_size*seq_len, self.esm_embedding_size))
+        output = self.fc_in(output)
+        #(N*L, F*fc1) --> (F, N*L, fc1)
+        output = output.view(batch_size*seq_len, self.num_of_folds, self.fc1_size).transpose(0, 1)
+        for w, b in zip(self.hidden_weights, self.hidden_biases):
+            output = torch.baddbmm(b, torch.relu(output), w)
+        #(F, N*L, num_of_classes)
+        return output
+
+    def predict_probs(self, antigen):
+        """
+        (F, N*L) epitope probabilities, one row per fold
+        """
+        return torch.softmax(self(antigen), dim=2)[:, :, 1]
+
+LoadedFoldEnsemble = namedtuple("LoadedFoldEnsemble", ["module", "model_states", "classification_thresholds", "threshold_keys"])
+
+#(model dir, precision, device, compile mode, compiled cache dir) --> LoadedFoldEnsemble, like esm_registry does for ESM-2
+_fold_ensembles = {}
+
+
+def get_fold_ensemble(m_path, model_architecture, precision="fp32", device="cpu", compile_mode=None, compiled_cache_dir=None):
+    """
+    the BP3FoldEnsemble of the fold weights in m_path, ready for inference at precision on
+    device. the first call loads the weights (and traces or compiles the ensemble), every
+    following call in the same process with the same settings reuses it.
+    """
+    key = (str(m_path), precision, str(device), compile_mode, str(compiled_cache_dir))
+    if key not in _fold_ensembles:
+        _fold_ensembles[key] = load_fold_ensemble(m_path, model_architecture, precision, device, compile_mode, compiled_cache_dir)
+    return _fold_ensembles[key]
+
+
+def load_fold_ensemble(m_path, model_architecture, precision="fp32", device="cpu", compile_mode=None, compiled_cache_dir=None):
+    """
+    loads the fold weights in m_path and builds the ensemble, see get_fold_ensemble
+    """
+    #a packed bundle (see weight_bundle, made by initialize_bepipred30_artifacts) is one memory
+    #mapped load, otherwise every fold file is read on its own
+    bundle_path = weight_bundle.bundle_path(m_path)
+    bundle = weight_bundle.load_weight_bundle(bundle_path) if bundle_path.is_file() else None
+    if bundle is not None and not weight_bundle.bundle_is_current(bundle, m_path):
+        print(f"The fold files in {m_path} changed since {bundle_path} was packed, loading them instead. "
+              "Repack it with pack_bepipred30_bundles.")
+        bundle = None
+    if bundle is not None:
+        folds = bundle["manifest"]["folds"]
+        model_states = [m_path / fold["file"] for fold in folds]
+        classification_thresholds = bundle["classification_thresholds"]
+        threshold_keys = [fold["name"] for fold in folds]
+        fold_state_dicts = bundle["state_dicts"]
+        checksum = bundle["manifest"]["weights_checksum"]
+    else:
+        #same fold order as a packed bundle, so both give the same weights_checksum and share traces
+        model_states = sorted(m_path.glob("*Fold*"))
+        classification_thresholds = CLASSIFICATION_THRESHOLDS[m_path.name]
+        threshold_keys = [model_state.stem for model_state in model_states]
+        fold_state_dicts = [torch.load(model_state, map_location=device) for model_state in model_states]
+        checksum = None
+
+    #stack every fold's weights into one batched module
+    fold_ensemble = BP3FoldEnsemble(model_architecture, fold_state_dicts).to(device)
+    fold_ensemble.eval()
+    if precision == "int8":
+        if torch.device(device).type != "cpu":
+            sys.exit("int8 inference is only supported on CPU.")
+        fold_ensemble = quantize_linear_layers(fold_ensemble, inplace=True)
+
+    if compile_mode == "torchscript" and precision == "bf16":
+        print("TorchScript tracing does not support bf16 autocast, running the BP3 ensemble eagerly.")
+    elif compile_mode == "torchscript":
+        if compiled_cache_dir is None:
+            compiled_cache_dir = MODELS_PATH / "compiled"
+        if checksum is None:
+            checksum = weights_checksum(model_states)
+        trace_name = f"{m_path.name}_{precision}_{checksum}_torch{torch.__version__}.pt"
+        fold_ensemble = trace_fold_ensemble(fold_ensemble, Path(compiled_cache_dir) / trace_name, device)
+    elif compile_mode == "torch_compile":
+        fold_ensemble = compile_fold_ensemble(fold_ensemble)
+
+    return LoadedFoldEnsemble(fold_ensemble, model_states, classification_thresholds, threshold_keys)
+
+
 ### CLASSES ###
 
 class Antigens():
     def __init__(self, seq, esm_encoding_dir, design_name,
-        add_seq_len=False, run_esm_model_local=None):
+        add_seq_len=False, run_esm_model_local=None, esm_batch_size=10,
+        persist_embeddings=False, esm_cache=None, esm_window_size=None, esm_window_overlap=128,
+        precision="fp32", esm_max_tokens=None, compile_mode=None, precomputed_encodings=None):
         """
         Initialize Antigens class object
         Inputs:
+            seq: amino acid sequence, or a list of sequences to encode together
+            esm_encoding_dir: directory for the per-residue ESM-2 encodings, only used with persist_embeddings
+            design_name: name of the design, or a list of names matching seq
+            esm_batch_size: number of sequences per ESM-2 forward pass
+            esm_max_tokens: if set, sequences are sorted by length and batched under this padded
+                token budget instead of in fixed groups of esm_batch_size
+            persist_embeddings: write the encodings to esm_encoding_dir with torch.save. by default they
+                are kept in memory and handed straight to BP3EnsemblePredict.
+            esm_cache: optional esm_cache.ESMEmbeddingCache consulted before running ESM-2
+            esm_window_size: encode sequences longer than this many residues as overlapping windows
+                that are stitched back into one full-length encoding, e.g. 1022 for ESM-2.
+                None encodes every sequence in one piece.
+            esm_window_overlap: number of residues shared by neighbouring windows
+            precision: ESM-2 inference precision, "fp32", "bf16" (autocast) or "int8" (dynamic
+                quantization of the Linear layers, CPU only). see precision_report for the score drift.
+            compile_mode: "torch_compile" runs ESM-2 through torch.compile, None and "torchscript" keep it eager
+            precomputed_encodings: per-residue ESM-2 encodings matching seq, e.g. attached from
+                shm_transport. they are used as is and ESM-2 is not run.
             device: pytorch device to use, default is cuda if available else cpu.
         """
 
         self.esm_encoding_dir = esm_encoding_dir
         self.run_esm_model_local = run_esm_model_local
-
-        try:
-            esm_encoding_dir.mkdir(parents=True, exist_ok=False)
-        except FileExistsError:
-            print("Directory for esm encodings already there. Saving encodings there.")
-        else:
-            print("Directory for esm encodings not found. Made new one.")
+        self.esm_batch_size = esm_batch_size
+        self.esm_max_tokens = esm_max_tokens
+        self.persist_embeddings = persist_embeddings
+        self.esm_cache = esm_cache
+        self.esm_window_size = esm_window_size
+        self.esm_window_overlap = esm_window_overlap
+        self.precision = check_precision(precision)
+        self.compile_mode = check_compile_mode(compile_mode)
+        self.precomputed_encodings = precomputed_encodings
+
+        if esm_window_size is not None and not 0 <= esm_window_overlap < esm_window_size:
+            sys.exit(f"esm_window_overlap must be between 0 and esm_window_size ({esm_window_size}), got {esm_window_overlap}.")
+
+        if persist_embeddings:
+            if esm_encoding_dir is None:
+                sys.exit("persist_embeddings requires an esm_encoding_dir to save the encodings to.")
+            try:
+                esm_encoding_dir.mkdir(parents=True, exist_ok=False)
+            except FileExistsError:
+                print("Directory for esm encodings already there. Saving encodings there.")
+            else:
+                print("Directory for esm encodings not found. Made new one.")
 
         self.accs, self.seqs = self.read_seq(seq, design_name)
         # self.accs, self.seqs = self.read_accs_and_sequences_from_fasta(fasta_file)
@@ -135,11 +310,22 @@ class Antigens():
         #self.create_fasta_for_esm_transformer()
         self.add_seq_len = add_seq_len
         print(f"Number of sequences detected: {num_of_seqs}")
-        print(f"ESM-2 encoding sequences. Saving encodings to {str(esm_encoding_dir)}")
+        if persist_embeddings:
+            print(f"ESM-2 encoding sequences. Saving encodings to {str(esm_encoding_dir)}")
+        else:
+            print("ESM-2 encoding sequences. Keeping encodings in memory")
         self.esm_encoding_paths = self.get_esm2_represention_on_accs_seqs()
         self.ensemble_preds = None
         self.ensemble_probs = None
 
+    def get_esm_encoding(self, idx):
+        """
+        per-residue ESM-2 encoding of antigen idx, from memory or from the persisted file
+        """
+        if self.persist_embeddings:
+            return torch.load(self.esm_encoding_paths[idx])
+        return self.esm_encodings[idx]
+
     def check_accepted_AAs(self, accs, sequences):
         accepted_AAs = set(["A", "R", "N", "D", "C", "Q", "E", "G", "H", "I", "L", "K", "M", "F", "P", "S", "T", "W", "Y", "V"])
         entries = list( zip(accs, sequences) ) 
@@ -157,6 +343,54 @@ class Antigens():
         for i in range(0, length, batch_size):
             yield data[i:i + batch_size]
 
+    def token_budget_generator(self, data, lengths, max_tokens):
+        """
+        sorts data by length (longest first) and yields batches whose padded size,
+        batch count * (longest sequence + BOS/EOS tokens), stays within max_tokens.
+        a sequence that alone exceeds the budget gets a batch of its own.
+        """
+        order = sorted(range(len(data)), key=lambda i: lengths[i], reverse=True)
+        batch = list()
+        batch_max_len = 0
+        for i in order:
+            padded_len = lengths[i] + 2
+            if batch and (len(batch) + 1) * max(batch_max_len, padded_len) > max_tokens:
+                yield batch
+                batch = list()
+                batch_max_len = 0
+            batch.append(data[i])
+            batch_max_len = max(batch_max_len, padded_len)
+        if batch:
+            yield batch
+
+
+    def esm_windows(self, seq_len):
+        """
+        (start, end, keep_start, keep_end) tiles covering a sequence. without windowing, or for
+        sequences that fit in one window, this is the whole sequence. otherwise windows of
+        esm_window_size residues overlap by at least esm_window_overlap and every residue is
+        taken from the window where it sits furthest from an edge.
+        """
+        window = self.esm_window_size
+        if window is None or seq_len <= window:
+            return [(0, seq_len, 0, seq_len)]
+
+        stride = window - self.esm_window_overlap
+        starts = list(range(0, seq_len - window, stride)) + [seq_len - window]
+        ends = [start + window for start in starts]
+        #split every overlap at its midpoint
+        boundaries = [0] + [(starts[k+1] + ends[k]) // 2 for k in range(len(starts) - 1)] + [seq_len]
+
+        return [(starts[k], ends[k], boundaries[k], boundaries[k+1]) for k in range(len(starts))]
+
+    def esm_cache_variant(self, seq):
+        #stitched and reduced precision embeddings differ from full-context fp32 ones, so they get their own cache entries
+        variant = list()
+        if self.esm_window_size is not None and len(seq) > self.esm_window_size:
+            variant.append(f"window{self.esm_window_size}_overlap{self.esm_window_overlap}")
+        if self.precision != "fp32":
+            variant.append(self.precision)
+        return "_".join(variant)
 
     def get_esm2_represention_on_accs_seqs(self):
         """
@@ -164,62 +398,119 @@ class Antigens():
         per_res_representations:
         """
 
-        # Load ESM-2 model
-        if self.run_esm_model_local is not None:
-            print(f"Loading ESM2 from: {self.run_esm_model_local}")
-            model, alphabet = esm.pretrained.load_model_and_alphabet(self.run_esm_model_local)
-            
-        else: model, alphabet = esm.pretrained.esm2_t33_650M_UR50D()
-        batch_converter = alphabet.get_batch_converter()
-        model.eval()
+        encode_start = time.perf_counter()
 
         #esm_representations = []
         #preparing batch for ESM2
         upper_case_sequences = [s.upper() for s in self.seqs]
         data = list(zip(self.accs, upper_case_sequences))
         nr_seqs = len(data)
-        batch_generator = self.tuple_generator(data)
         
-        enc_id = 0
-        enc_paths = []
+        enc_paths = [None]*nr_seqs if self.persist_embeddings else []
+        self.esm_encodings = [None]*nr_seqs if not self.persist_embeddings else []
+
+        #look up embeddings of sequences we have already seen, only the rest goes through ESM-2
+        to_encode = list()
+        for enc_id, (acc, seq) in enumerate(data):
+            cached = None
+            if self.precomputed_encodings is not None:
+                cached = self.precomputed_encodings[enc_id]
+            elif self.esm_cache is not None:
+                cached = self.esm_cache.get(seq, self.esm_cache_variant(seq))
+            if cached is None:
+                to_encode.append(enc_id)
+            else:
+                self.store_esm_representation(enc_id, acc, cached, enc_paths)
+
+        if self.esm_cache is not None:
+            print(f"ESM-2 embedding cache: {nr_seqs - len(to_encode)} hit(s), {len(to_encode)} miss(es)")
+
+        #every sequence is split into one or more windows, windows of all sequences are batched together
+        chunks = list()
+        pieces = dict()
+        for enc_id in to_encode:
+            windows = self.esm_windows(len(data[enc_id][1]))
+            pieces[enc_id] = [None]*len(windows)
+            chunks.extend((enc_id, k, window) for k, window in enumerate(windows))
+
+        if chunks:
+            # ESM-2 model is loaded once per process and shared between Antigens objects
+            model, alphabet = get_esm2_model(self.run_esm_model_local, precision=self.precision,
+                                             compiled=self.compile_mode == "torch_compile")
+            batch_converter = alphabet.get_batch_converter()
+            if self.esm_max_tokens is not None:
+                #results are placed back by enc_id, so the length sorted order never leaks out
+                chunk_lens = [end - start for _, _, (start, end, _, _) in chunks]
+                batch_generator = self.token_budget_generator(chunks, chunk_lens, self.esm_max_tokens)
+            else:
+                batch_generator = self.tuple_generator(chunks, batch_size=self.esm_batch_size)
+        else:
+            batch_generator = []
 
+        nr_encoded = 0
         for b in batch_generator:
 
-            batch_labels, batch_strs, batch_tokens = batch_converter(b)
+            batch_data = [(data[enc_id][0], data[enc_id][1][start:end]) for enc_id, _, (start, end, _, _) in b]
+            batch_labels, batch_strs, batch_tokens = batch_converter(batch_data)
             batch_lens = (batch_tokens != alphabet.padding_idx).sum(1)
             acc_names = batch_labels
 
             # Extract per-residue representations
-            with torch.no_grad():
+            with torch.no_grad(), inference_context(self.precision):
                 results = model(batch_tokens, repr_layers=[33])
-            token_representations = results["representations"][33]
+            token_representations = results["representations"][33].float()
     
             #encoding sequences
             for i, tokens_len in enumerate(batch_lens):
 
-                esm_representation = token_representations[i, 1 : tokens_len - 1]
-                if self.add_seq_len:
-                    esm_representation = self.add_seq_len_feature(esm_representation)
+                enc_id, k, (start, end, keep_start, keep_end) = b[i]
+                #clone so the slice doesn't keep the whole padded batch alive
+                pieces[enc_id][k] = token_representations[i, 1 + keep_start - start : 1 + keep_end - start].clone()
+                if any(piece is None for piece in pieces[enc_id]):
+                    continue
+
+                esm_representation = pieces.pop(enc_id)
+                esm_representation = esm_representation[0] if len(esm_representation) == 1 else torch.cat(esm_representation)
+                seq = data[enc_id][1]
+                if self.esm_cache is not None:
+                    self.esm_cache.put(seq, esm_representation, self.esm_cache_variant(seq))
 
-                enc_path = self.esm_encoding_dir / f"{acc_names[i]}_{enc_id}.pt"
-                torch.save(esm_representation, enc_path)
+                self.store_esm_representation(enc_id, acc_names[i], esm_representation, enc_paths)
+                nr_encoded += 1
 
-                enc_paths.append(enc_path)
-                enc_id += 1
+                print(f"ESM-2 encoded sequence {acc_names[i]} {nr_encoded}/{len(to_encode)}")
 
-                print(f"ESM-2 encoded sequence {acc_names[i]} {enc_id}/{nr_seqs}")
+        self.esm_encode_time = time.perf_counter() - encode_start
+        print(f"ESM-2 encoding of {nr_seqs} sequence(s) took {self.esm_encode_time:.2f}s")
 
         return enc_paths
-    
 
+    def store_esm_representation(self, enc_id, acc, esm_representation, enc_paths):
+        if self.add_seq_len:
+            esm_representation = self.add_seq_len_feature(esm_representation)
+
+        if self.persist_embeddings:
+            enc_path = self.esm_encoding_dir / f"{acc}_{enc_id}.pt"
+            torch.save(esm_representation, enc_path)
+            enc_paths[enc_id] = enc_path
+        else:
+            self.esm_encodings[enc_id] = esm_representation
+    
 
     def read_seq(self, seq, design_name): 
         accs = list()
         sequences = list()
 
-        #just make the code an a, can replace with something more meaningful if needed
-        accs.append(design_name)
-        sequences.append(seq)
+        #several designs can be encoded together, one accession per design
+        if isinstance(seq, (list, tuple)):
+            if len(seq) != len(design_name):
+                sys.exit(f"Got {len(seq)} sequences but {len(design_name)} design names.")
+            accs.extend(design_name)
+            sequences.extend(seq)
+        else:
+            #just make the code an a, can replace with something more meaningful if needed
+            accs.append(design_name)
+            sequences.append(seq)
 
         return accs, sequences
         
@@ -286,11 +577,18 @@ class BP3EnsemblePredict():
                  device = None,
                  rolling_window_size = 9,
                  top_pred_pct=0.3, 
-                 gpu=False):
+                 gpu=False,
+                 precision="fp32",
+                 compile_mode=None,
+                 compiled_cache_dir=None):
         """
         Inputs and initialization:
             antigens: Antigens class object
             device: pytorch device to use, default is cuda if available else cpu.
+            precision: inference precision of the FFNN heads, "fp32", "bf16" (autocast) or
+                "int8" (dynamic quantization of the fused first layer, CPU only)
+            compile_mode: None (eager), "torchscript" (trace of the fold ensemble, cached on disk in
+                compiled_cache_dir, default BP3Models/compiled) or "torch_compile"
             
         """
         
@@ -298,11 +596,12 @@ class BP3EnsemblePredict():
         self.antigens = antigens
         self.rolling_window_size = rolling_window_size 
         self.top_pred_pct = top_pred_pct
+        self.precision = check_precision(precision)
+        self.compile_mode = check_compile_mode(compile_mode)
 
 
         if gpu: 
-            if device is None:
-                self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            self.device = device if device is not None else detect_device()
         else:
             self.device = "cpu"
         
@@ -311,24 +610,17 @@ class BP3EnsemblePredict():
         if antigens.add_seq_len:
             self.model_architecture = MyDenseNetWithSeqLen()
             m_path = MODELS_PATH / "BP3C50IDSeqLenFFNN" 
-            self.model_states = list( m_path.glob("*Fold*") )
-            self.classification_thresholds = {'Fold1': 0.21326530612244898,
-                                              'Fold2': 0.15510204081632653,
-                                              'Fold3': 0.1163265306122449,
-                                              'Fold4': 0.09693877551020408,
-                                              'Fold5': 0.19387755102040816}
-            self.threshold_keys = [model_state.stem for model_state in self.model_states] 
-
         else:
             self.model_architecture = MyDenseNet()
             m_path = MODELS_PATH / "BP3C50IDFFNN" 
-            self.model_states = list( m_path.glob("*Fold*") )
-            self.classification_thresholds = {'Fold1': 0.2326530612244898,
-                                              'Fold2': 0.15510204081632653,
-                                              'Fold3': 0.1163265306122449,
-                                              'Fold4': 0.15510204081632653,
-                                              'Fold5': 0.19387755102040816}
-            self.threshold_keys = [model_state.stem for model_state in self.model_states]
+
+        #built once per process for each model directory, precision, device and compile mode
+        fold_ensemble = get_fold_ensemble(m_path, self.model_architecture, self.precision, self.device,
+                                          self.compile_mode, compiled_cache_dir)
+        self.model_states = fold_ensemble.model_states
+        self.classification_thresholds = fold_ensemble.classification_thresholds
+        self.threshold_keys = fold_ensemble.threshold_keys
+        self.fold_ensemble = fold_ensemble.module
 
 
         #user specified classification thresholds for each fold
@@ -337,9 +629,9 @@ class BP3EnsemblePredict():
 
 
     def compute_rolling_mean_on_bp3_prob_outputs(self, antigen_avg_ensemble_probs):
-        #same=ensures that the rolling mean output will have the same length as the number of residues for antigen.
-        antigen_avg_ensemble_probs = antigen_avg_ensemble_probs.cpu().detach().numpy()
-        return np.convolve(antigen_avg_ensemble_probs, np.ones(self.rolling_window_size), 'same') / self.rolling_window_size
+        if torch.is_tensor(antigen_avg_ensemble_probs):
+            antigen_avg_ensemble_probs = antigen_avg_ensemble_probs.cpu().detach().numpy()
+        return postprocess.rolling_mean(antigen_avg_ensemble_probs, self.rolling_window_size)
 
     def run_bp3_ensemble(self):
         """
@@ -349,39 +641,39 @@ class BP3EnsemblePredict():
                 No outputs. Stores probabilities of ensemble models in Antigens() class object.
                 Run bp3_pred_variable_threshold() or bp3_pred_majority_vote() afterwards to make predictions. 
         """
-        num_of_models = len(self.model_states)
-        ensemble_probs = list()
-        threshold_keys = list()
-        softmax_function = nn.Softmax(dim=1)
-        model = self.model_architecture
+        fold_probs_per_antigen = list()
 
-        data = list( zip(self.antigens.accs, self.antigens.seqs, self.antigens.esm_encoding_paths) )
         print("Generating BepiPred-3.0 scores")
-        for acc, seq, esm_encoding_path in data:
-            ensemble_prob = list()
-            all_model_preds = list()
-            num_residues = len(seq)
-            esm_encoding = torch.load(esm_encoding_path)
+        for idx in range(len(self.antigens.seqs)):
+            esm_encoding = self.antigens.get_esm_encoding(idx)
             esm_encoding = torch.unsqueeze(esm_encoding, 0).to(self.device)
             
-            for i in range(num_of_models):
-                with torch.no_grad():
-                
-                    model_state = self.model_states[i] 
-                    model.load_state_dict(torch.load(model_state, map_location=self.device))
-                    model = model.to(self.device)
-                    model.eval()
-                    model_output = model(esm_encoding)
-                    model_probs = softmax_function(model_output)[:, 1]
+            with torch.no_grad(), inference_context(self.precision, self.device):
+                fold_probs = self.fold_ensemble.predict_probs(esm_encoding).float()
 
-                    ensemble_prob.append(model_probs)
-
-            ensemble_probs.append(ensemble_prob)
+            fold_probs_per_antigen.append(fold_probs.cpu().numpy())
         
         self.bp3_ensemble_run = True
-        self.antigens.ensemble_probs = ensemble_probs
+        #one contiguous (residues, folds) buffer for all antigens, see postprocess.EnsembleProbs
+        self.antigens.ensemble_probs = postprocess.EnsembleProbs(fold_probs_per_antigen)
 
 
+    def bp3_scores(self, idx, var_threshold=0.1512):
+        """
+        vectorized post-processing of antigen idx, see postprocess.bp3_scores
+        """
+        fold_thresholds = [self.classification_thresholds[threshold_key] for threshold_key in self.threshold_keys]
+        ensemble_probs = self.antigens.ensemble_probs
+        return postprocess.bp3_scores(ensemble_probs[idx], len(self.antigens.seqs[idx]), fold_thresholds,
+                                      rolling_window_size=self.rolling_window_size,
+                                      top_pred_pct=self.top_pred_pct,
+                                      var_threshold=var_threshold,
+                                      avg_prob=ensemble_probs.avg(idx))
+
+    def warn_if_truncated(self, acc, seq, ensemble_pred_len):
+        if ensemble_pred_len < len(seq):
+            print(f"Sequence longer than what the ESM-2 trasnformer can encode entirely, {acc}. Outputting predictions up till {ensemble_pred_len} position.")
+
     def create_toppct_files(self, outfile_path):
         try:
             outfile_path.mkdir(parents=True, exist_ok=False)
@@ -392,37 +684,21 @@ class BP3EnsemblePredict():
             sys.exit("BP3 ensemble has not been run, so predictions cannot be made.\
                 Use method run_bp3_ensemble(antigens).")
         else:
-            antigens = self.antigens
-            data = list( zip(self.antigens.accs, self.antigens.seqs, self.antigens.ensemble_probs) )
-            epi_toppct_outfile_content = str()
-            linepi_toppct_outfile_content = str()
-
-            for acc, seq, ensemble_prob in data:
-                num_residues  = len(seq)
-                avg_prob = torch.mean(torch.stack(ensemble_prob, axis=1), axis=1)
-                avg_prob_rolling_mean = self.compute_rolling_mean_on_bp3_prob_outputs(avg_prob) 
-                ensemble_pred_len = len(avg_prob)
+            data = list( zip(self.antigens.accs, self.antigens.seqs) )
+            epi_toppct_outfile_content = list()
+            linepi_toppct_outfile_content = list()
 
-                if ensemble_pred_len < num_residues:
-                    print(f"Sequence longer than what the ESM-2 trasnformer can encode entirely, {acc}. Outputting predictions up till {ensemble_pred_len} position.")
-
-                #get top % predictions
-                nr_top_cands = round(num_residues*self.top_pred_pct)
-                
-                top_preds =[res_idx for res_idx, _ in sorted( [(idx, p) for idx, p in enumerate(avg_prob)], key=lambda pair: pair[1],  reverse=True)][:nr_top_cands]
-                epitope_preds = "".join([seq[i].upper() if i in top_preds else seq[i].lower() for i in range(ensemble_pred_len)])
-                epi_toppct_outfile_content += f">{acc}\n{epitope_preds}\n"
-
-                top_preds =[res_idx for res_idx, _ in sorted( [(idx, p) for idx, p in enumerate(avg_prob_rolling_mean)], key=lambda pair: pair[1],  reverse=True)][:nr_top_cands]
-                epitope_preds = "".join([seq[i].upper() if i in top_preds else seq[i].lower() for i in range(ensemble_pred_len)])
-                linepi_toppct_outfile_content += f">{acc}\n{epitope_preds}\n"
+            for idx, (acc, seq) in enumerate(data):
+                scores = self.bp3_scores(idx)
+                self.warn_if_truncated(acc, seq, len(scores.avg_prob))
 
+                #top % predictions on the scores and on their rolling mean
+                epi_toppct_outfile_content.append(f">{acc}\n{postprocess.epitope_string(seq, scores.top_pct_mask)}")
+                linepi_toppct_outfile_content.append(f">{acc}\n{postprocess.epitope_string(seq, scores.linear_top_pct_mask)}")
 
             #write top candidates file
-            outfile_content = epi_toppct_outfile_content[:-1]
-            with open(outfile_path  / f"Bcell_epitope_top_{round(self.top_pred_pct*100)}pct_preds.fasta", "w") as outfile: outfile.write(outfile_content)
-            outfile_content = linepi_toppct_outfile_content[:-1]
-            with open(outfile_path  / f"Bcell_linepitope_top_{round(self.top_pred_pct*100)}pct_preds.fasta", "w") as outfile: outfile.write(outfile_content)
+            with open(outfile_path  / f"Bcell_epitope_top_{round(self.top_pred_pct*100)}pct_preds.fasta", "w") as outfile: outfile.write("\n".join(epi_toppct_outfile_content))
+            with open(outfile_path  / f"Bcell_linepitope_top_{round(self.top_pred_pct*100)}pct_preds.fasta", "w") as outfile: outfile.write("\n".join(linepi_toppct_outfile_content))
 
     def create_csvfile(self, outfile_path, design_name):
         try:
@@ -434,28 +710,41 @@ class BP3EnsemblePredict():
             sys.exit("BP3 ensemble has not been run, so predictions cannot be made.\
                 Use method run_bp3_ensemble(antigens).")
         else:
-            antigens = self.antigens
-            data = list( zip(self.antigens.accs, self.antigens.seqs, self.antigens.ensemble_probs) )
-            combined_csv_format = str()
-            combined_csv_format += "Accession,Residue,BepiPred-3.0 score,BepiPred-3.0 linear epitope score"
-
-            for acc, seq, ensemble_prob in data:
-                num_residues  = len(seq)
-                avg_prob = torch.mean(torch.stack(ensemble_prob, axis=1), axis=1)
-                #avg_prob = np.mean(np.stack(ensemble_prob, axis=1), axis=1)
-                avg_prob_rolling_mean = self.compute_rolling_mean_on_bp3_prob_outputs(avg_prob) 
-                ensemble_pred_len = len(avg_prob)
-
-                if ensemble_pred_len < num_residues:
-                    print(f"Sequence longer than what the ESM-2 trasnformer can encode entirely, {acc}. Outputting predictions up till {ensemble_pred_len} position.")
+            data = list( zip(self.antigens.accs, self.antigens.seqs) )
+            combined_csv_format = [CSV_HEADER]
 
-                csv_format = [f"{acc},{seq[i].upper()},{avg_prob[i]}, {avg_prob_rolling_mean[i]}" for i in range(ensemble_pred_len)]
-                csv_format = "\n".join(csv_format)
-                combined_csv_format += f"\n{csv_format}"
+            for idx in range(len(data)):
+                combined_csv_format.append(self.csv_rows(idx))
 
             #write raw csv file
             with open(outfile_path  / f"bepipred3_{design_name}.csv", "w") as outfile:
-                outfile.write(combined_csv_format)
+                outfile.write("\n".join(combined_csv_format))
+
+    def csv_rows(self, idx):
+        acc, seq = self.antigens.accs[idx], self.antigens.seqs[idx]
+        scores = self.bp3_scores(idx)
+        self.warn_if_truncated(acc, seq, len(scores.avg_prob))
+        return postprocess.csv_rows(acc, seq, scores)
+
+    def create_csvfiles(self, outfile_path):
+        """
+        writes one bepipred3_<acc>.csv per antigen, used when several designs were
+        encoded and scored together. each file matches what create_csvfile writes
+        for a single design.
+        """
+        try:
+            outfile_path.mkdir(parents=True, exist_ok=False)
+        except FileExistsError:
+            print("Directory B-cell epitope predictions already there. Saving results there.")
+
+        if not self.bp3_ensemble_run:
+            sys.exit("BP3 ensemble has not been run, so predictions cannot be made.\
+                Use method run_bp3_ensemble(antigens).")
+
+        data = list( zip(self.antigens.accs, self.antigens.seqs) )
+        for idx, (acc, seq) in enumerate(data):
+            with open(outfile_path / f"bepipred3_{acc}.csv", "w") as outfile:
+                outfile.write(f"{CSV_HEADER}\n{self.csv_rows(idx)}")
 
         
     def bp3_pred_variable_threshold(self, outfile_path, var_threshold = 0.1512):
@@ -471,31 +760,22 @@ class BP3EnsemblePredict():
             sys.exit("BP3 ensemble has not been run, so predictions cannot be made.\
  Use method run_bp3_ensemble(antigens).")
         else:
-            data = list( zip(self.antigens.accs, self.antigens.seqs, self.antigens.ensemble_probs) )
+            data = list( zip(self.antigens.accs, self.antigens.seqs) )
             ensemble_preds = list()
-            outfile_content = str()
+            outfile_content = list()
             
             #go through each antigen
-            for acc, seq, ensemble_prob in data:
-                all_model_preds = list()
-                num_residues = len(seq)
-                #avg_prob = np.mean(np.stack(ensemble_prob, axis=1), axis=1)
-                avg_prob = torch.mean(torch.stack(ensemble_prob, axis=1), axis=1)
-                ensemble_pred = [1 if res >= var_threshold else 0 for res in avg_prob]
-
-                ensemble_pred_len = len(ensemble_pred)
-                if ensemble_pred_len < num_residues:
-                    print(f"Sequence longer than what the ESM-2 trasnformer can encode entirely, {acc}. Outputting predictions up till {ensemble_pred_len} position.")
-
-                epitope_preds = "".join([seq[i].upper() if ensemble_pred[i] == 1 else seq[i].lower() for i in range( ensemble_pred_len )])
-                outfile_content += f">{acc}\n{epitope_preds}\n"
-                ensemble_preds.append(ensemble_pred)
+            for idx, (acc, seq) in enumerate(data):
+                scores = self.bp3_scores(idx, var_threshold=var_threshold)
+                self.warn_if_truncated(acc, seq, len(scores.avg_prob))
+
+                outfile_content.append(f">{acc}\n{postprocess.epitope_string(seq, scores.variable_threshold_pred == 1)}")
+                ensemble_preds.append(scores.variable_threshold_pred.tolist())
             
             self.antigens.ensemble_preds = ensemble_preds
-            outfile_content = outfile_content[:-1]
             #saving output to fasta formatted output file
             with open(outfile_path  / "Bcell_epitope_preds.fasta", "w") as outfile:
-                outfile.write(outfile_content)
+                outfile.write("\n".join(outfile_content))
             
     def bp3_pred_majority_vote(self, outfile_path):
         """
@@ -512,39 +792,22 @@ class BP3EnsemblePredict():
             sys.exit("BP3 ensemble has not been run, so predictions cannot be made.\
  Use method run_bp3_ensemble(antigens).")
         else:
-            data = list( zip(self.antigens.accs, self.antigens.seqs, self.antigens.ensemble_probs) )
+            data = list( zip(self.antigens.accs, self.antigens.seqs) )
             ensemble_preds = list()
-            outfile_content = str()
+            outfile_content = list()
             
             #go through each antigen
-            for acc, seq, ensemble_prob in data:
-                all_model_preds = list()
-                num_residues = len(seq)
-                
-                #collect all predictions of all models in ensemble
-                for i in range( len(ensemble_prob) ):
-                    model_probs = ensemble_prob[i]
-                    classification_threshold = self.classification_thresholds[ self.threshold_keys[i] ]
-                    model_preds = [1 if res >= classification_threshold else 0 for res in model_probs]
-                    all_model_preds.append(model_preds)
-                    
-                #ensemble majority vote 
-                ensemble_pred = np.asarray(all_model_preds)
-                ensemble_pred_len = np.shape(ensemble_pred)[1]
+            for idx, (acc, seq) in enumerate(data):
+                scores = self.bp3_scores(idx)
+                self.warn_if_truncated(acc, seq, len(scores.avg_prob))
 
-                if ensemble_pred_len < num_residues:
-                    print(f"Sequence longer than what the ESM-2 trasnformer can encode entirely, {acc}. Outputting predictions up till {ensemble_pred_len} position.")
-                
-                ensemble_pred = [np.argmax( np.bincount(ensemble_pred[:, i]) ) for i in range(ensemble_pred_len)]
-                epitope_preds = "".join([seq[i].upper() if ensemble_pred[i] == 1 else seq[i].lower() for i in range( len(ensemble_pred) )])
-                outfile_content += f">{acc}\n{epitope_preds}\n"
-                ensemble_preds.append(ensemble_pred)
+                outfile_content.append(f">{acc}\n{postprocess.epitope_string(seq, scores.majority_vote == 1)}")
+                ensemble_preds.append(scores.majority_vote.tolist())
             
             self.antigens.ensemble_preds = ensemble_preds
-            outfile_content = outfile_content[:-1]
             #saving output to fasta formatted output file
             with open(outfile_path / "Bcell_epitope_preds.fasta", "w") as outfile:
-                outfile.write(outfile_content)
+                outfile.write("\n".join(outfile_content))
 
 
     def add_line_breaks(self, seq, every_x_line = 128):
@@ -569,42 +832,32 @@ class BP3EnsemblePredict():
         """
         function for filtering out thresholds, which dont change the prediction. 
         This is an optimization, so that a lot fewer frames are used per plotly plot.
+        the prediction only changes at the thresholds right above a score, see postprocess.threshold_change_points
         """
-        nr_thresholds = len(thresholds)
-        prev_pred = "".join([residues[i].upper() if avg_prob[i] >= thresholds[0] else residues[i].lower() for i in range(ensemble_pred_len)])
-        filtered_thresholds = list()
-        filtered_thresholds.append(thresholds[0])
-        for i in range(1, nr_thresholds):
-            t = thresholds[i]
-            current_pred = "".join([residues[i].upper() if avg_prob[i] >= t else residues[i].lower() for i in range(ensemble_pred_len)])
-            if current_pred != prev_pred:
-                filtered_thresholds.append(t)
-                prev_pred = current_pred
-            else:
-                pass
-
-        filtered_thresholds = np.asarray(filtered_thresholds)
+        #residues without case (e.g. gaps) look the same either way, so they never change the prediction string
+        has_case = np.array([res.upper() != res.lower() for res in residues[:ensemble_pred_len]], dtype=bool)
+        filtered_thresholds = postprocess.threshold_change_points(np.asarray(avg_prob[:ensemble_pred_len])[has_case], thresholds)
     
         return filtered_thresholds
     
     def insert_into_html(self, pattern, html_file_content, what_to_insert):
         """
-        For inserting java code into html file 
+        For inserting java code into html file, in front of every occurrence of pattern (single pass)
         """
-        
-        search_from = 0
-        idx_to_insert_at = 0
-        while idx_to_insert_at != -1:
-    
-            idx_to_insert_at = html_file_content.find(pattern, search_from + 1)
-            if idx_to_insert_at != -1:
-                html_file_content = html_file_content[:idx_to_insert_at] + what_to_insert + html_file_content[idx_to_insert_at:]
-                search_from = idx_to_insert_at+len(what_to_insert)
-    
-        return html_file_content
+        return html_file_content.replace(pattern, what_to_insert + pattern)
     
     
-    def bp3_generate_plots(self, outfile_path, var_threshold=0.1512, num_interactive_figs=50, use_rolling_mean=False):
+    def bp3_generate_plots(self, outfile_path, var_threshold=0.1512, num_interactive_figs=50, use_rolling_mean=False, compact=False):
+        """
+        writes output_interactive_figures.html with a threshold slider per design.
+        compact=True writes every design's scores once and lets a shared script in the page
+        compute the slider, instead of a plotly frame (with a copy of the bar trace) per threshold.
+        """
+        import pandas as pd
+        import plotly.express as px
+        import plotly.graph_objects as go
+        from plotly.offline import get_plotlyjs_version
+
         try:
             outfile_path.mkdir(parents=True, exist_ok=False)
         except FileExistsError:
@@ -623,21 +876,21 @@ class BP3EnsemblePredict():
             thresholds = np.round(np.linspace(0, 1, nr_thresholds), decimals=5)
             y_init = [var_threshold, var_threshold]
             interactive_figure_list = list()
-            data = list( zip(self.antigens.accs, self.antigens.seqs, self.antigens.ensemble_probs) )
+            compact_designs = list()
+            data = list( zip(self.antigens.accs, self.antigens.seqs) )
 
             print("Creating figures")
-            for acc, seq, ensemble_prob in data:
+            for idx, (acc, seq) in enumerate(data):
 
                 epitope_preds_at_diff_thresh = list()
                 seq_len  = len(seq)
-                avg_prob = torch.mean(torch.stack(ensemble_prob, axis=1), axis=1)
+                avg_prob = self.antigens.ensemble_probs.avg(idx)
                 
                 if use_rolling_mean and seq_len >= self.rolling_window_size:
-                    avg_prob = self.compute_rolling_mean_on_bp3_prob_outputs(avg_prob)
+                    avg_prob = postprocess.rolling_mean(avg_prob, self.rolling_window_size)
                     plot_title = f"BepiPred-3.0 linear epitope scores on {self.add_line_breaks(acc)}"
 
                 else:
-                    avg_prob = avg_prob.cpu().detach().numpy()
                     plot_title = f"BepiPred-3.0 epitope scores on {self.add_line_breaks(acc)}"
                     
                     if use_rolling_mean:
@@ -664,6 +917,11 @@ class BP3EnsemblePredict():
                 else:
                     figure_height_update = 200 + num_line_breaks*8
                     y_coord = -0.37 - 0.05*num_line_breaks
+
+                if compact:
+                    if len(compact_designs) < num_interactive_figs:
+                        compact_designs.append(compact_plots.design_entry(acc, self.add_line_breaks(acc), seq, avg_prob, plot_title, figure_height_update, y_coord))
+                    continue
             
                 d = {"BP3EpiProbScore": avg_prob, "Residue": residues, "SeqPos": res_counts, "Accession": acc_col}
                 df = pd.DataFrame(data=d)
@@ -683,8 +941,9 @@ class BP3EnsemblePredict():
                     first_indice_above = -1
                     np.append(filtered_thresholds, var_threshold)
                 
-                for t in filtered_thresholds:
-                    epitope_preds_at_diff_thresh.append(f"{self.add_line_breaks(acc)} (A/a=Epitope/Non-epitope), Threshold: {t}<br>"+self.add_line_breaks("".join([residues[i].upper() if avg_prob[i] >= t else residues[i].lower() for i in range(ensemble_pred_len )])))
+                epitope_strings = postprocess.epitope_strings_at_thresholds("".join(residues), avg_prob, filtered_thresholds)
+                for t, epitope_string in zip(filtered_thresholds, epitope_strings):
+                    epitope_preds_at_diff_thresh.append(f"{self.add_line_breaks(acc)} (A/a=Epitope/Non-epitope), Threshold: {t}<br>"+self.add_line_breaks(epitope_string))
                 
                 
                 #create initial figure
@@ -740,6 +999,11 @@ class BP3EnsemblePredict():
                     )
                     interactive_figure_list.append(figa)
             
+            if compact:
+                compact_plots.write_compact_html(outfile_path / "output_interactive_figures.html", compact_designs, thresholds, var_threshold,
+                                                 get_plotlyjs_version(), every_x_line=every_x_line)
+                return
+
             #write interactive plots
             with open(outfile_path / "output_interactive_figures.html", 'w') as f:
                 for figure in interactive_figure_list:
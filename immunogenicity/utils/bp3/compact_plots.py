@@ -0,0 +1,179 @@
+import json
+import base64
+import numpy as np
+
+"""
+compact interactive BepiPred-3.0 plots. every design's scores are written once, as base64
+float32, and one shared script draws the figures and works out the threshold slider in the
+browser. the html grows with the number of residues instead of residues x thresholds.
+"""
+
+PLOTLY_CDN = "https://cdn.plot.ly/plotly-{version}.min.js"
+
+#placeholders are filled in one pass by fill_template
+HTML_TEMPLATE = """<html>
+<head>
+<meta charset="utf-8">
+<script charset="utf-8" src="%%PLOTLY_SRC%%"></script>
+</head>
+<body>
+<div id="bp3-figures"></div>
+<script type="application/json" id="bp3-data">%%DATA%%</script>
+<script>
+%%SCRIPT%%
+</script>
+</body>
+</html>
+"""
+
+PLOT_SCRIPT = """
+(function() {
+  const payload = JSON.parse(document.getElementById("bp3-data").textContent);
+  const thresholds = payload.thresholds;
+  const varThreshold = payload.var_threshold;
+  const everyXLine = payload.every_x_line;
+
+  function decodeScores(b64) {
+    const bytes = Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+    return new Float32Array(bytes.buffer);
+  }
+
+  function addLineBreaks(s) {
+    const n = Math.floor(s.length / everyXLine);
+    if (n < 1) return s;
+    let parts = [];
+    for (let i = 0; i < n; i++) parts.push(s.slice(i*everyXLine, (i+1)*everyXLine));
+    parts.push(s.slice(n*everyXLine));
+    return parts.join("<br>");
+  }
+
+  //first index with thresholds[k] > p
+  function upperBound(p) {
+    let lo = 0, hi = thresholds.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1;
+      if (thresholds[mid] <= p) lo = mid + 1; else hi = mid;
+    }
+    return lo;
+  }
+
+  //thresholds where the call of at least one residue changes, plus var threshold
+  function changePoints(seq, scores) {
+    let flips = new Set();
+    for (let i = 0; i < scores.length; i++) {
+      if (seq[i].toUpperCase() === seq[i].toLowerCase()) continue;
+      const k = upperBound(scores[i]);
+      if (k >= 1 && k < thresholds.length) flips.add(k);
+    }
+    let kept = [thresholds[0]].concat(Array.from(flips).sort((a, b) => a - b).map(k => thresholds[k]));
+    let active = kept.findIndex(t => t >= varThreshold);
+    if (active >= 0) kept.splice(active, 0, varThreshold);
+    else active = kept.length - 1;
+    return [kept, active];
+  }
+
+  //python prints whole floats as 0.0 and 1.0
+  function fmt(t) {
+    return Number.isInteger(t) ? t.toFixed(1) : String(t);
+  }
+
+  function epitopeString(seq, scores, t) {
+    let out = new Array(scores.length);
+    for (let i = 0; i < scores.length; i++) out[i] = scores[i] >= t ? seq[i].toUpperCase() : seq[i].toLowerCase();
+    return out.join("");
+  }
+
+  function annotation(design, scores, t) {
+    const text = `${design.acc_label} (A/a=Epitope/Non-epitope), Threshold: ${fmt(t)}<br>` + addLineBreaks(epitopeString(design.seq, scores, t));
+    return {text: `<b>${text}</b>`, align: "left", showarrow: false, xref: "paper", yref: "paper", x: 0.0, y: design.y_coord,
+            bgcolor: "#F9C68F", font: {family: "Courier New, monospace"}, bordercolor: "#2C596A"};
+  }
+
+  function thresholdLine(t, n) {
+    return {type: "line", x0: 1, x1: n, y0: t, y1: t, line: {color: "#2C596A", dash: "dash"}};
+  }
+
+  const downloadConfig = {
+    modeBarButtonsToAdd: [{
+      name: "Download epitope predictions",
+      icon: Plotly.Icons.disk,
+      direction: "up",
+      click: function(gd) {let str = new String(gd.layout.annotations[0].text.toString()); let filename = new String(gd.layout.title.text.toString()).replaceAll(" ", "_"); let seq = ">" + str.replaceAll("<b>", "").replaceAll("</b>", "").replaceAll("<br>", "\\n"); let blob = new Blob([seq], {type: "text/plain"}); let link = document.createElement("a"); let url = URL.createObjectURL(blob); link.setAttribute("href", url); link.setAttribute("download", filename + ".fasta"); link.style.visibility = "hidden"; document.body.appendChild(link); link.click(); document.body.removeChild(link);}
+    }],
+    responsive: true
+  };
+
+  const container = document.getElementById("bp3-figures");
+  payload.designs.forEach(function(design) {
+    const scores = decodeScores(design.scores);
+    const n = scores.length;
+    const [kept, active] = changePoints(design.seq, scores);
+    const positions = Array.from({length: n}, (_, i) => i + 1);
+    const residues = design.seq.slice(0, n).split("");
+
+    const div = document.createElement("div");
+    div.style.height = "700px";
+    div.style.width = "100%";
+    container.appendChild(div);
+
+    const bar = {type: "bar", x: positions, y: Array.from(scores), customdata: residues,
+                 marker: {color: Array.from(scores), coloraxis: "coloraxis"},
+                 hovertemplate: "Sequence position=%{x}<br>BepiPred-3.0 epitope score=%{y}<br>Residue=%{customdata}<br>Accession=" + design.acc + "<extra></extra>"};
+    const layout = {
+      title: {text: design.title}, height: 700, margin: {b: design.margin_b},
+      xaxis: {title: {text: "Sequence position"}}, yaxis: {title: {text: "BepiPred-3.0 epitope score"}},
+      coloraxis: {colorscale: "Plasma", colorbar: {title: {text: "BepiPred-3.0 epitope score"}}},
+      shapes: [thresholdLine(kept[active], n)],
+      annotations: [annotation(design, scores, kept[active])],
+      sliders: [{
+        active: active, len: 0.9, tickcolor: "#2C596A", font: {color: "#2C596A"},
+        currentvalue: {xanchor: "left", prefix: "<b>Threshold: </b>", font: {color: "#2C596A"}},
+        steps: kept.map(t => ({label: fmt(t), method: "skip", args: [t]}))
+      }]
+    };
+    Plotly.newPlot(div, [bar], layout, downloadConfig);
+    div.on("plotly_sliderchange", function(e) {
+      const t = kept[e.slider.active];
+      Plotly.relayout(div, {shapes: [thresholdLine(t, n)], annotations: [annotation(design, scores, t)]});
+    });
+  });
+})();
+"""
+
+
+def design_entry(acc, acc_label, seq, scores, title, margin_b, y_coord):
+    """
+    json ready description of one design, scores are sent as little endian float32 so the
+    browser compares exactly the values the python writers do.
+    """
+    scores = np.ascontiguousarray(scores, dtype="<f4")
+    return {"acc": acc,
+            "acc_label": acc_label,
+            "seq": seq[:len(scores)],
+            "scores": base64.b64encode(scores.tobytes()).decode("ascii"),
+            "title": title,
+            "margin_b": margin_b,
+            "y_coord": y_coord}
+
+
+def fill_template(template, values):
+    """
+    replaces every %%KEY%% in template with values[KEY], scanning the template once
+    """
+    parts = template.split("%%")
+    #odd parts sit between a pair of markers
+    return "".join(values[part] if i % 2 else part for i, part in enumerate(parts))
+
+
+def write_compact_html(outfile, designs, thresholds, var_threshold, plotlyjs_version, every_x_line=128):
+    payload = {"thresholds": [float(t) for t in thresholds],
+               "var_threshold": float(var_threshold),
+               "every_x_line": every_x_line,
+               "designs": designs}
+    #keep the json from closing the script tag it sits in
+    data = json.dumps(payload, separators=(",", ":")).replace("</", "<\\/")
+    html = fill_template(HTML_TEMPLATE, {"PLOTLY_SRC": PLOTLY_CDN.format(version=plotlyjs_version),
+                                         "DATA": data,
+                                         "SCRIPT": PLOT_SCRIPT})
+    with open(outfile, "w") as f:
+        f.write(html)
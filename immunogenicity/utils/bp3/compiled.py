@@ -0,0 +1,73 @@
+import hashlib
+import torch
+from pathlib import Path
+
+"""
+compiled execution for the BepiPred-3.0 path.
+    torchscript: the fused fold ensemble is traced once, saved next to the BP3 weights and
+        reloaded with torch.jit.load on later runs. ESM-2 stays eager.
+    torch_compile: the fold ensemble and ESM-2 go through torch.compile. inductor keeps its
+        compiled kernels in its own on-disk cache (TORCHINDUCTOR_CACHE_DIR), so later runs
+        skip most of the compile time.
+"""
+
+COMPILE_MODES = (None, "torchscript", "torch_compile")
+
+
+def check_compile_mode(compile_mode):
+    if compile_mode not in COMPILE_MODES:
+        raise ValueError(f"Unknown compile mode {compile_mode}, choose one of {COMPILE_MODES}")
+    return compile_mode
+
+
+def weights_checksum(model_states):
+    """
+    sha256 over the fold weight files, part of the traced module's file name so a traced
+    ensemble is never reused with different weights
+    """
+    digest = hashlib.sha256()
+    for model_state in model_states:
+        with open(model_state, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class CompiledFoldEnsemble():
+    """
+    same predict_probs interface as BP3FoldEnsemble, backed by a TorchScript trace or torch.compile
+    """
+    def __init__(self, predict_probs):
+        self.predict_probs = predict_probs
+
+
+def trace_fold_ensemble(fold_ensemble, cache_path, device="cpu"):
+    """
+    loads the traced ensemble from cache_path, tracing and saving it there first if needed
+    """
+    cache_path = Path(cache_path)
+    if cache_path.is_file():
+        print(f"Loading traced BP3 ensemble from {cache_path}")
+        return CompiledFoldEnsemble(torch.jit.load(str(cache_path), map_location=device).predict_probs)
+
+    #sequence length is read from the input at run time, the example length does not matter
+    example = torch.zeros(1, 16, fold_ensemble.esm_embedding_size, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace_module(fold_ensemble, {"predict_probs": (example,)})
+    traced = torch.jit.freeze(traced.eval(), preserved_attrs=["predict_probs"])
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    torch.jit.save(traced, str(tmp_path))
+    tmp_path.replace(cache_path)
+    print(f"Traced BP3 ensemble saved to {cache_path}")
+
+    return CompiledFoldEnsemble(traced.predict_probs)
+
+
+def compile_fold_ensemble(fold_ensemble):
+    #sequence lengths vary per design, compile with dynamic shapes to avoid a recompile per length
+    return CompiledFoldEnsemble(torch.compile(fold_ensemble.predict_probs, dynamic=True))
+
+
+def compile_esm2_model(model):
+    return torch.compile(model, dynamic=True)
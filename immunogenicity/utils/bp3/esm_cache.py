@@ -0,0 +1,143 @@
+import os
+import hashlib
+import numpy as np
+import torch
+from pathlib import Path
+
+"""
+content addressed on-disk cache for per-residue ESM-2 embeddings. entries are keyed
+by sha256(model id + sequence) and stored as .npy files so they can be memory mapped
+on read. the least recently used entries are evicted once the cache grows past max_bytes.
+several processes can share one cache directory, each re-reads the directory size after
+writing RESCAN_FRACTION of max_bytes, so together they overshoot it by at most
+processes * RESCAN_FRACTION * max_bytes before one of them evicts.
+"""
+
+RESCAN_FRACTION = 0.05
+
+
+class ESMEmbeddingCache():
+    def __init__(self, cache_dir, model_id, max_bytes=50 * 1024**3):
+        """
+        Inputs:
+            cache_dir: directory holding the cached .npy embeddings, shared between runs
+            model_id: identity of the ESM model the embeddings come from, e.g. esm2_t33_650M_UR50D
+                or the path of a local checkpoint
+            max_bytes: size budget of the cache, least recently used entries are evicted beyond it
+        """
+        self.cache_dir = Path(cache_dir)
+        self.model_id = str(model_id)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        #size of the directory at the last scan plus what this process wrote since, computed
+        #from disk the first time it is needed. other processes' writes only show up on a rescan
+        self._size_bytes = None
+        self._unscanned_bytes = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, seq, variant=""):
+        """
+        variant separates embeddings of the same sequence computed differently, e.g. windowed
+        """
+        content = f"{self.model_id}\n{seq.upper()}" if not variant else f"{self.model_id}\n{variant}\n{seq.upper()}"
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def entry_path(self, seq, variant=""):
+        key = self.key(seq, variant)
+        #fan out over subdirectories to keep directory sizes manageable
+        return self.cache_dir / key[:2] / f"{key}.npy"
+
+    def get(self, seq, variant=""):
+        """
+        returns the cached (L, E) embedding of seq as a tensor backed by a copy-on-write
+        memory map, or None on a miss.
+        """
+        path = self.entry_path(seq, variant)
+        try:
+            arr = np.load(path, mmap_mode="c")
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        #mtime is the LRU clock
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return torch.from_numpy(arr)
+
+    def put(self, seq, embedding, variant=""):
+        path = self.entry_path(seq, variant)
+        path.parent.mkdir(exist_ok=True)
+        #write then rename so concurrent readers never see a partial file
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, embedding.detach().cpu().numpy().astype(np.float32))
+        os.replace(tmp_path, path)
+
+        written = path.stat().st_size
+        if self._size_bytes is not None:
+            self._size_bytes += written
+            self._unscanned_bytes += written
+        if self._size_bytes is None or self._size_bytes > self.max_bytes or self._unscanned_bytes > RESCAN_FRACTION * self.max_bytes:
+            #our total looks full (or is stale), the directory itself says how full it really is
+            self._size_bytes = self.size_bytes()
+            self._unscanned_bytes = 0
+            if self._size_bytes > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        return list(self.cache_dir.glob("*/*.npy"))
+
+    def size_bytes(self):
+        total = 0
+        for p in self.entries():
+            try:
+                total += p.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def evict(self, low_water=0.9):
+        """
+        removes least recently used entries until the cache is under low_water * max_bytes,
+        the headroom keeps us from rescanning the cache on every put once it is full.
+        """
+        entries = list()
+        for p in self.entries():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * low_water
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= target:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+
+        self._size_bytes = total
+        self._unscanned_bytes = 0
+
+    def clear(self):
+        for p in self.entries():
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+        self._size_bytes = 0
+        self._unscanned_bytes = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,107 @@
+import time
+import torch
+
+from immunogenicity.utils.bp3.precision import check_precision, quantize_linear_layers
+from immunogenicity.utils.bp3.compiled import compile_esm2_model
+
+"""
+process level registry for the ESM-2 transformer. loading esm2_t33_650M_UR50D
+deserializes ~650M parameters, so we do it once per process and hand the same
+model/alphabet pair to every Antigens object that asks for it.
+"""
+
+DEFAULT_ESM_MODEL = "esm2_t33_650M_UR50D"
+
+_loaded_models = {}
+_load_times = {}
+
+
+def esm2_model_id(run_esm_model_local=None):
+    """
+    name the registry (and the embedding cache) uses for a model
+    """
+    if run_esm_model_local is not None:
+        return str(run_esm_model_local)
+    return DEFAULT_ESM_MODEL
+
+
+def get_esm2_model(run_esm_model_local=None, precision="fp32", compiled=False):
+    """
+    returns (model, alphabet) for the pretrained ESM-2 model, or for the local
+    checkpoint in run_esm_model_local. the first call loads the weights, every
+    following call in the same process reuses them.
+
+    precision="int8" returns a copy with dynamically quantized Linear layers, also
+    cached. if the fp32 model is not loaded yet it is quantized in place so only
+    the int8 copy stays in memory. bf16 uses the fp32 weights under autocast.
+
+    compiled=True returns the model wrapped in torch.compile, sharing the eager model's weights.
+    """
+    precision = check_precision(precision)
+    model_id = esm2_model_id(run_esm_model_local)
+    key = (model_id, "int8" if precision == "int8" else "fp32")
+
+    if compiled:
+        compiled_key = key + ("compiled",)
+        if compiled_key not in _loaded_models:
+            model, alphabet = get_esm2_model(run_esm_model_local, precision=precision)
+            _loaded_models[compiled_key] = (compile_esm2_model(model), alphabet)
+            _load_times[compiled_key] = 0.0
+        return _loaded_models[compiled_key]
+
+    if key not in _loaded_models:
+        import esm
+        start = time.perf_counter()
+        if precision == "int8" and (model_id, "fp32") in _loaded_models:
+            model, alphabet = _loaded_models[(model_id, "fp32")]
+            model = quantize_linear_layers(model)
+        else:
+            if run_esm_model_local is not None:
+                print(f"Loading ESM2 from: {run_esm_model_local}")
+                model, alphabet = esm.pretrained.load_model_and_alphabet(str(run_esm_model_local))
+            else:
+                model, alphabet = esm.pretrained.esm2_t33_650M_UR50D()
+            model.eval()
+            if precision == "int8":
+                model = quantize_linear_layers(model, inplace=True)
+        model.eval()
+        _loaded_models[key] = (model, alphabet)
+        _load_times[key] = time.perf_counter() - start
+        print(f"ESM-2 model {model_id} ({key[1]}) loaded in {_load_times[key]:.2f}s")
+
+    return _loaded_models[key]
+
+
+def _keys(run_esm_model_local=None):
+    model_id = esm2_model_id(run_esm_model_local)
+    return [key for key in _loaded_models if key[0] == model_id]
+
+
+def is_esm2_model_loaded(run_esm_model_local=None):
+    return len(_keys(run_esm_model_local)) > 0
+
+
+def esm2_load_time(run_esm_model_local=None):
+    """
+    seconds spent loading the given model (all precisions), None if it has not been loaded in this process
+    """
+    times = [_load_times[key] for key in _keys(run_esm_model_local)]
+    return sum(times) if times else None
+
+
+def release_esm2_model(run_esm_model_local=None):
+    """
+    drop the registry's references to one model, in every precision, so its memory can be reclaimed.
+    """
+    for key in _keys(run_esm_model_local):
+        _loaded_models.pop(key, None)
+        _load_times.pop(key, None)
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def release_all_esm2_models():
+    _loaded_models.clear()
+    _load_times.clear()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
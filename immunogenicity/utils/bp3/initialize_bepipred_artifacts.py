@@ -5,8 +5,12 @@ import requests
 import tarfile
 
 
-def initialize_bepipred30_artifacts(): 
-
+def initialize_bepipred30_artifacts(pack_bundles=True): 
+    """
+    downloads the BP3 fold weights into BP3Models. with pack_bundles=True every model
+    directory is also packed into one memory mappable <dir>.bundle.pt, which
+    BP3EnsemblePredict loads instead of the separate fold files.
+    """
     
 
     bp3_dir = os.path.join(os.path.dirname(__file__), 'BP3Models/')
@@ -63,6 +67,24 @@ def initialize_bepipred30_artifacts():
     else:
         print(f"Failed to download file. HTTP status code: {seqlen_response.status_code}")
 
+    if pack_bundles:
+        pack_bepipred30_bundles(bp3_dir)
+
+
+def pack_bepipred30_bundles(bp3_dir=None):
+    from immunogenicity.utils.bp3.bepipred3 import CLASSIFICATION_THRESHOLDS
+    from immunogenicity.utils.bp3.weight_bundle import pack_weight_bundle
+
+    if bp3_dir is None:
+        bp3_dir = os.path.join(os.path.dirname(__file__), 'BP3Models/')
+
+    for model_dir, classification_thresholds in CLASSIFICATION_THRESHOLDS.items():
+        model_path = os.path.join(bp3_dir, model_dir)
+        if os.path.isdir(model_path):
+            pack_weight_bundle(model_path, classification_thresholds)
+        else:
+            print(f"No {model_dir} weights found in {bp3_dir}, not packing a bundle for it.")
+
 
 
 if __name__ == "__main__": 
@@ -0,0 +1,180 @@
+import numpy as np
+import torch
+from collections import namedtuple
+
+"""
+vectorized post-processing of BepiPred-3.0 ensemble probabilities. everything the output
+writers need for one antigen is computed from the (folds, residues) probability array in
+one go with numpy array operations.
+"""
+
+BP3Scores = namedtuple("BP3Scores", ["avg_prob",
+                                     "rolling_mean",
+                                     "top_pct_mask",
+                                     "linear_top_pct_mask",
+                                     "majority_vote",
+                                     "variable_threshold_pred"])
+
+
+class EnsembleProbs():
+    """
+    fold probabilities of many antigens in one contiguous float32 buffer of shape
+    (total residues, folds) plus offsets, instead of a list of per fold tensors per antigen.
+    ensemble_probs[i] is a zero copy (folds, residues) view of antigen i.
+    """
+    def __init__(self, fold_probs):
+        """
+        Inputs:
+            fold_probs: list of (folds, residues) probability arrays/tensors, one per antigen
+        """
+        lengths = [probs.shape[1] for probs in fold_probs]
+        self.offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(lengths)
+        num_folds = fold_probs[0].shape[0] if fold_probs else 0
+        self.buffer = np.empty((self.offsets[-1], num_folds), dtype=np.float32)
+        for i, probs in enumerate(fold_probs):
+            if torch.is_tensor(probs):
+                probs = probs.detach().cpu().numpy()
+            self.buffer[self.offsets[i]:self.offsets[i+1]] = probs.T
+        self._avg = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        return self.buffer[self.offsets[idx]:self.offsets[idx+1]].T
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def averages(self):
+        """
+        fold average of every residue, computed once. the buffer is laid out like the
+        old torch.stack(ensemble_prob, axis=1) so the mean is bit identical to it.
+        """
+        if self._avg is None:
+            self._avg = torch.mean(torch.from_numpy(self.buffer), axis=1).numpy()
+        return self._avg
+
+    def avg(self, idx):
+        return self.averages()[self.offsets[idx]:self.offsets[idx+1]]
+
+
+def fold_probs_array(ensemble_prob):
+    """
+    list of per fold 1-D probability tensors --> (folds, residues) float32 numpy array
+    """
+    if isinstance(ensemble_prob, np.ndarray):
+        return ensemble_prob
+    return torch.stack(ensemble_prob).detach().cpu().numpy()
+
+
+def ensemble_average(ensemble_prob):
+    """
+    mean over the folds. tensors are averaged with torch so the scores stay bit identical
+    to what the writers have always printed.
+    """
+    if isinstance(ensemble_prob, np.ndarray):
+        return ensemble_prob.mean(axis=0)
+    return torch.mean(torch.stack(ensemble_prob, axis=1), axis=1).detach().cpu().numpy()
+
+
+def rolling_mean(avg_prob, rolling_window_size):
+    #same=ensures that the rolling mean output will have the same length as the number of residues for antigen.
+    return np.convolve(avg_prob, np.ones(rolling_window_size), 'same')[:len(avg_prob)] / rolling_window_size
+
+
+def top_pct_mask(scores, nr_top_cands):
+    """
+    boolean mask of the nr_top_cands highest scores. ties keep sequence order, like a stable
+    descending sort.
+    """
+    mask = np.zeros(len(scores), dtype=bool)
+    mask[np.argsort(-scores, kind="stable")[:nr_top_cands]] = True
+    return mask
+
+
+def bp3_scores(ensemble_prob, num_residues, fold_thresholds, rolling_window_size=9, top_pred_pct=0.3,
+               var_threshold=0.1512, avg_prob=None):
+    """
+    Inputs:
+        ensemble_prob: (folds, residues) probabilities or list of per fold tensors
+        num_residues: length of the antigen sequence, the top % is taken of this
+        fold_thresholds: classification threshold of every fold, in fold order
+        avg_prob: already computed fold average, e.g. EnsembleProbs.avg
+    Outputs:
+        BP3Scores with the ensemble average, its rolling mean, the top % masks on both,
+        the majority vote of the per fold calls and the call at var_threshold.
+    """
+    fold_probs = fold_probs_array(ensemble_prob)
+    if avg_prob is None:
+        avg_prob = ensemble_average(ensemble_prob)
+    avg_prob_rolling_mean = rolling_mean(avg_prob, rolling_window_size)
+
+    nr_top_cands = round(num_residues*top_pred_pct)
+
+    #a residue is an epitope if more than half of the folds call it one
+    fold_calls = fold_probs >= np.asarray(fold_thresholds, dtype=fold_probs.dtype)[:, None]
+    majority_vote = (2*fold_calls.sum(axis=0) > len(fold_probs)).astype(int)
+
+    return BP3Scores(avg_prob=avg_prob,
+                     rolling_mean=avg_prob_rolling_mean,
+                     top_pct_mask=top_pct_mask(avg_prob, nr_top_cands),
+                     linear_top_pct_mask=top_pct_mask(avg_prob_rolling_mean, nr_top_cands),
+                     majority_vote=majority_vote,
+                     variable_threshold_pred=(avg_prob >= var_threshold).astype(int))
+
+
+def epitope_string(seq, mask):
+    """
+    sequence with predicted epitope residues in upper case and the rest in lower case,
+    cut to the length of mask
+    """
+    seq = seq[:len(mask)]
+    residues = np.where(mask, list(seq.upper()), list(seq.lower()))
+    return "".join(residues.tolist())
+
+
+def csv_rows(acc, seq, scores):
+    n = len(scores.avg_prob)
+    residues = seq[:n].upper()
+    return "\n".join(f"{acc},{res},{p}, {r}" for res, p, r in zip(residues, scores.avg_prob.tolist(), scores.rolling_mean.tolist()))
+
+
+def threshold_change_points(scores, thresholds):
+    """
+    keeps thresholds[0] and every threshold at which the call of at least one residue
+    changes (score >= threshold). thresholds must be sorted ascending. a residue with
+    score p flips exactly at the first threshold above p, so the kept thresholds are
+    found with one sort of the thresholds and a searchsorted of the scores.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    flips = np.unique(np.searchsorted(thresholds, np.asarray(scores, dtype=np.float64), side="right"))
+    flips = flips[(flips >= 1) & (flips < len(thresholds))]
+    return np.concatenate([thresholds[:1], thresholds[flips]])
+
+
+def epitope_strings_at_thresholds(seq, scores, thresholds):
+    """
+    epitope_string of seq at every threshold in thresholds (sorted ascending). residues are
+    lowercased in score order as the threshold passes them, so building all strings costs
+    O(L log L) plus the size of the strings themselves.
+    """
+    seq = seq[:len(scores)]
+    chars = bytearray(seq.upper(), "ascii")
+    lower = bytearray(seq.lower(), "ascii")
+    #compare in float64 like the python float thresholds do
+    scores = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(scores, kind="stable")
+    sorted_scores = scores[order]
+    #residues [0, passed) of order are already lower case
+    passed = 0
+    for t in thresholds:
+        below = int(np.searchsorted(sorted_scores, t, side="left"))
+        for i in order[passed:below]:
+            chars[i] = lower[i]
+        passed = max(passed, below)
+        yield chars.decode("ascii")
@@ -0,0 +1,33 @@
+import contextlib
+import torch
+import torch.nn as nn
+
+"""
+reduced precision inference for the BepiPred-3.0 path. fp32 is the reference,
+bf16 runs the forward passes under CPU/GPU autocast and int8 dynamically
+quantizes the nn.Linear layers (weights int8, activations quantized on the fly).
+"""
+
+PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def check_precision(precision):
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown inference precision {precision}, choose one of {PRECISIONS}")
+    return precision
+
+
+def quantize_linear_layers(model, inplace=False):
+    """
+    dynamic int8 quantization of every nn.Linear in model, only supported on CPU
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=inplace)
+
+
+def inference_context(precision, device="cpu"):
+    """
+    context manager to run a forward pass in; only bf16 needs one, int8 is baked into the weights
+    """
+    if check_precision(precision) == "bf16":
+        return torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
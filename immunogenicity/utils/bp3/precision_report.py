@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import pandas as pd
+from pathlib import Path
+
+from immunogenicity.utils.bp3 import bepipred3 as bp3
+from immunogenicity.utils.bp3 import esm_registry
+from immunogenicity.utils.bp3.precision import check_precision
+
+
+def score_reference_set(seqs, accs, precision, add_seq_len=False, run_esm_model_local=None, esm_batch_size=10,
+                        warmup=1):
+    """
+    returns ([per design average BP3 scores as numpy arrays], seconds spent) at the given precision.
+    the seconds only cover ESM-2 encoding and BP3 scoring: the ESM-2 model is loaded through
+    esm_registry and the first warmup designs are run once before anything is timed, and the
+    fold weights are loaded outside the timer.
+    """
+    esm_registry.get_esm2_model(run_esm_model_local, precision=precision)
+    if warmup:
+        run_reference_set(seqs[:warmup], accs[:warmup], precision, add_seq_len, run_esm_model_local, esm_batch_size)
+    antigens, elapsed = run_reference_set(seqs, accs, precision, add_seq_len, run_esm_model_local, esm_batch_size)
+
+    scores = [antigens.ensemble_probs.avg(idx).copy() for idx in range(len(antigens.ensemble_probs))]
+    return scores, elapsed
+
+
+def run_reference_set(seqs, accs, precision, add_seq_len=False, run_esm_model_local=None, esm_batch_size=10):
+    """
+    --> (scored Antigens, seconds spent encoding and scoring)
+    """
+    start = time.perf_counter()
+    antigens = bp3.Antigens(seqs, None, accs, add_seq_len=add_seq_len, run_esm_model_local=run_esm_model_local,
+                            esm_batch_size=esm_batch_size, precision=precision)
+    elapsed = time.perf_counter() - start
+    bp3_predict = bp3.BP3EnsemblePredict(antigens, precision=precision)
+    start = time.perf_counter()
+    bp3_predict.run_bp3_ensemble()
+    elapsed += time.perf_counter() - start
+    return antigens, elapsed
+
+
+def bp3_precision_report(seqs, accs, precision, var_threshold=0.1512, add_seq_len=False,
+                         run_esm_model_local=None, esm_batch_size=10):
+    """
+    scores a reference set at fp32 and at the reduced precision and compares the per-residue
+    BepiPred-3.0 scores. returns a per design dataframe and a summary dict with the score
+    drift, the fraction of residues whose epitope call at var_threshold is unchanged and the
+    speedup over fp32.
+    """
+    check_precision(precision)
+    ref_scores, ref_time = score_reference_set(seqs, accs, "fp32", add_seq_len, run_esm_model_local, esm_batch_size)
+    test_scores, test_time = score_reference_set(seqs, accs, precision, add_seq_len, run_esm_model_local, esm_batch_size)
+
+    rows = list()
+    for acc, ref, test in zip(accs, ref_scores, test_scores):
+        diff = abs(test - ref)
+        rows.append({"Accession": acc,
+                     "residues": len(ref),
+                     "max_abs_diff": float(diff.max()),
+                     "mean_abs_diff": float(diff.mean()),
+                     "call_agreement": float(((ref >= var_threshold) == (test >= var_threshold)).mean())})
+    df = pd.DataFrame(rows)
+
+    nr_residues = df["residues"].sum()
+    summary = {"precision": precision,
+               "designs": len(df),
+               "residues": int(nr_residues),
+               "max_abs_diff": float(df["max_abs_diff"].max()),
+               "mean_abs_diff": float((df["mean_abs_diff"] * df["residues"]).sum() / nr_residues),
+               "call_agreement": float((df["call_agreement"] * df["residues"]).sum() / nr_residues),
+               "fp32_seconds": ref_time,
+               f"{precision}_seconds": test_time,
+               "speedup": ref_time / test_time}
+
+    return df, summary
+
+
+def read_fasta(fasta_fpath):
+    accs = list()
+    seqs = list()
+    with open(fasta_fpath, "r") as infile:
+        for line in infile:
+            line = line.strip()
+            if line.startswith(">"):
+                accs.append(line[1:])
+                seqs.append("")
+            elif line:
+                seqs[-1] += line
+    return accs, seqs
+
+
+if __name__ == "__main__":
+    #usage: python precision_report.py reference.fasta bf16|int8 [report.csv]
+    accs, seqs = read_fasta(Path(sys.argv[1]))
+    df, summary = bp3_precision_report(seqs, accs, sys.argv[2])
+    print(summary)
+    if len(sys.argv) > 3:
+        df.to_csv(sys.argv[3], index=False)
@@ -0,0 +1,234 @@
+import sys
+import queue
+import pickle
+import multiprocessing
+import numpy as np
+import torch
+from collections import namedtuple
+from multiprocessing import shared_memory, resource_tracker
+
+from immunogenicity.utils.bp3.worker_pool import available_cores
+
+"""
+shared memory transport for ESM-2 embeddings between an encoding process and BP3 scoring
+processes. the encoder copies every embedding once into a named shared memory segment and
+sends the workers a small handle, the workers map the segment and read the embedding in
+place instead of unpickling ~5 MB per 1000 residues. every segment is owned by the
+publisher, which unlinks it once all of its readers have released it.
+"""
+
+EmbeddingHandle = namedtuple("EmbeddingHandle", ["name", "shape", "dtype"])
+
+#seconds between worker liveness checks while the producer waits on the consumers
+POLL_INTERVAL = 1.0
+
+#set in every scoring worker by _init_consumer
+_release_queue = None
+
+
+class EmbeddingPublisher():
+    def __init__(self, ctx=None):
+        """
+        Inputs:
+            ctx: multiprocessing context the consumers are started from, releases come back
+                through a queue created in it
+        """
+        ctx = ctx or multiprocessing.get_context()
+        self.release_queue = ctx.Queue()
+        #segment name --> [SharedMemory, readers that still have to release it]
+        self.segments = dict()
+        #start the tracker before any fork so consumers register with ours instead of starting their own
+        resource_tracker.ensure_running()
+
+    def publish(self, embedding, readers=1):
+        """
+        copies embedding into a new shared memory segment and returns its handle.
+        the segment lives until readers releases have come back.
+        """
+        arr = embedding.detach().cpu().contiguous().numpy() if torch.is_tensor(embedding) else np.ascontiguousarray(embedding)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        self.segments[shm.name] = [shm, readers]
+        return EmbeddingHandle(shm.name, arr.shape, arr.dtype.str)
+
+    def in_flight(self):
+        return len(self.segments)
+
+    def collect(self, block=False, timeout=None):
+        """
+        applies the releases sent by consumers and frees segments nobody reads anymore,
+        block=True waits up to timeout seconds (None: forever) for at least one release.
+        returns the number of segments freed
+        """
+        freed = 0
+        while True:
+            try:
+                name = self.release_queue.get(block=block and freed == 0, timeout=timeout)
+            except queue.Empty:
+                return freed
+            entry = self.segments.get(name)
+            if entry is None:
+                continue
+            entry[1] -= 1
+            if entry[1] <= 0:
+                self.free(name)
+                freed += 1
+
+    def free(self, name):
+        shm, _ = self.segments.pop(name)
+        shm.close()
+        shm.unlink()
+
+    def close(self):
+        for name in list(self.segments):
+            try:
+                self.free(name)
+            except FileNotFoundError:
+                pass
+        self.release_queue.close()
+
+
+class AttachedEmbedding():
+    """
+    zero copy view of a published embedding in a consumer process
+    """
+    def __init__(self, handle):
+        self.handle = handle
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=handle.name, track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name=handle.name)
+        arr = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=self.shm.buf)
+        self.tensor = torch.from_numpy(arr)
+
+    def close(self):
+        self.tensor = None
+        try:
+            self.shm.close()
+        except BufferError:
+            #something still holds a view, the mapping goes away with it
+            pass
+
+
+def release(handle):
+    """
+    tells the publisher this consumer is done with handle
+    """
+    _release_queue.put(handle.name)
+
+
+def _init_consumer(release_queue, num_threads):
+    global _release_queue
+    _release_queue = release_queue
+    torch.set_num_threads(num_threads)
+
+
+def _consume(args):
+    consume_fn, handle, task, consume_kwargs = args
+    attached = AttachedEmbedding(handle)
+    try:
+        return consume_fn(attached.tensor, task, **consume_kwargs)
+    finally:
+        attached.close()
+        release(handle)
+
+
+def _consumer_loop(task_queue, result_queue, release_queue, num_threads):
+    """
+    scoring worker, runs (index, args) tasks until it gets None and sends back
+    (index, True, result) or (index, False, exception)
+    """
+    _init_consumer(release_queue, num_threads)
+    for index, args in iter(task_queue.get, None):
+        try:
+            result_queue.put((index, True, _consume(args)))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                #an exception that can't be pickled would be dropped by the queue and its task waited on forever
+                e = RuntimeError(repr(e))
+            result_queue.put((index, False, e))
+
+
+def check_workers(workers):
+    """
+    a worker that died (e.g. killed for memory) never finishes the task it was running and its
+    embedding is never released. raises instead of waiting on it forever
+    """
+    if any(worker.exitcode is not None for worker in workers):
+        raise RuntimeError("A BP3 scoring worker died, stopping the pipeline.")
+
+
+def run_two_stage_pipeline(produce, consume_fn, jobs, consume_kwargs=None, max_in_flight=None, num_threads=None):
+    """
+    runs produce() in this process and consume_fn(embedding, task, **consume_kwargs) in jobs
+    forked workers, handing embeddings over through shared memory so encoding and scoring
+    overlap. produce yields (embedding, task) pairs. consume_fn has to be a module level
+    function. at most max_in_flight embeddings (default 2*jobs) are published at a time,
+    the producer waits for releases beyond that. results come back in production order.
+    if a worker dies, a RuntimeError is raised instead of waiting for its task, and every
+    segment still in flight is unlinked either way.
+    """
+    consume_kwargs = consume_kwargs or {}
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("run_two_stage_pipeline needs the fork start method, which this platform does not support.")
+    if max_in_flight is None:
+        max_in_flight = 2 * jobs
+    if num_threads is None:
+        #the producer keeps a share of the cores for ESM-2
+        num_threads = max(1, available_cores() // (jobs + 1))
+
+    ctx = multiprocessing.get_context("fork")
+    publisher = EmbeddingPublisher(ctx)
+    task_queue = ctx.Queue()
+    result_queue = ctx.Queue()
+    print(f"Starting {jobs} BP3 scoring workers with {num_threads} torch thread(s) each, embeddings passed through shared memory")
+
+    #plain processes rather than a Pool, a Pool quietly replaces dead workers and keeps no public list of them
+    workers = [ctx.Process(target=_consumer_loop, args=(task_queue, result_queue, publisher.release_queue, num_threads), daemon=True)
+               for _ in range(jobs)]
+    try:
+        #fork before the producer loads anything, the workers only ever need the BP3 heads
+        for worker in workers:
+            worker.start()
+        submitted = 0
+        for embedding, task in produce():
+            publisher.collect()
+            while publisher.in_flight() >= max_in_flight:
+                if not publisher.collect(block=True, timeout=POLL_INTERVAL):
+                    check_workers(workers)
+            handle = publisher.publish(embedding)
+            task_queue.put((submitted, (consume_fn, handle, task, consume_kwargs)))
+            submitted += 1
+
+        #results arrive in completion order, indices put them back in production order
+        results = [None] * submitted
+        for _ in range(submitted):
+            while True:
+                try:
+                    index, ok, value = result_queue.get(timeout=POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    check_workers(workers)
+            if not ok:
+                raise value
+            results[index] = value
+
+        for worker in workers:
+            task_queue.put(None)
+        for worker in workers:
+            worker.join()
+        publisher.collect()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        #tasks nobody will read anymore mustn't keep this process from exiting
+        task_queue.cancel_join_thread()
+        task_queue.close()
+        result_queue.close()
+        publisher.close()
+
+    return results
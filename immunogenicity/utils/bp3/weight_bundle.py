@@ -0,0 +1,139 @@
+import os
+import hashlib
+import torch
+from pathlib import Path
+
+from immunogenicity.utils.bp3.compiled import weights_checksum
+
+"""
+packed BP3 weight bundles. all fold state dicts of one model directory (e.g. BP3C50IDFFNN),
+their classification thresholds and a manifest with checksums go into a single torch.save
+file next to the directory, which is loaded with mmap=True so a worker only maps it instead
+of deserializing every fold file on its own.
+"""
+
+BUNDLE_FORMAT_VERSION = 1
+
+#path --> (mtime, bundle), bundles are read only so one load per process is enough
+_loaded_bundles = {}
+
+
+def bundle_path(model_dir):
+    model_dir = Path(model_dir)
+    return model_dir.parent / f"{model_dir.name}.bundle.pt"
+
+
+def tensors_checksum(state_dict):
+    digest = hashlib.sha256()
+    for name in sorted(state_dict):
+        digest.update(name.encode())
+        digest.update(state_dict[name].detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def file_checksum(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def pack_weight_bundle(model_dir, classification_thresholds, out_path=None):
+    """
+    packs every *Fold* file of model_dir into one bundle, by default written to
+    <model_dir>.bundle.pt. folds are stored in file name order. the written bundle is read
+    back and its tensors checked against the manifest once here, so loads don't have to.
+    """
+    model_dir = Path(model_dir)
+    model_states = sorted(model_dir.glob("*Fold*"))
+    if not model_states:
+        raise FileNotFoundError(f"No fold weight files found in {model_dir}.")
+
+    state_dicts = list()
+    folds = list()
+    for model_state in model_states:
+        state_dict = torch.load(model_state, map_location="cpu")
+        if model_state.stem not in classification_thresholds:
+            raise KeyError(f"No classification threshold for fold {model_state.stem}.")
+        state_dicts.append(state_dict)
+        stat = model_state.stat()
+        folds.append({"name": model_state.stem,
+                      "file": model_state.name,
+                      "file_sha256": file_checksum(model_state),
+                      #cheap staleness check on load, see bundle_is_current
+                      "size": stat.st_size,
+                      "mtime_ns": stat.st_mtime_ns,
+                      "tensors_sha256": tensors_checksum(state_dict)})
+
+    manifest = {"format_version": BUNDLE_FORMAT_VERSION,
+                "model_dir": model_dir.name,
+                "folds": folds,
+                #same checksum the TorchScript cache names use, so traces are shared with unpacked loads
+                "weights_checksum": weights_checksum(model_states)}
+    bundle = {"manifest": manifest,
+              "classification_thresholds": {fold["name"]: float(classification_thresholds[fold["name"]]) for fold in folds},
+              "state_dicts": state_dicts}
+
+    out_path = Path(out_path) if out_path is not None else bundle_path(model_dir)
+    tmp_path = out_path.with_suffix(f".{os.getpid()}.tmp")
+    torch.save(bundle, tmp_path)
+    try:
+        verify_weight_bundle(torch.load(tmp_path, map_location="cpu", mmap=True, weights_only=True))
+    except ValueError:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+    print(f"Packed {len(folds)} folds of {model_dir.name} into {out_path}")
+    return out_path
+
+
+def verify_weight_bundle(bundle):
+    """
+    raises ValueError if a fold's tensors do not match the checksum recorded at packing time
+    """
+    manifest = bundle["manifest"]
+    if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported BP3 weight bundle format {manifest.get('format_version')}, expected {BUNDLE_FORMAT_VERSION}. Repack it.")
+    for fold, state_dict in zip(manifest["folds"], bundle["state_dicts"]):
+        if tensors_checksum(state_dict) != fold["tensors_sha256"]:
+            raise ValueError(f"Checksum mismatch for fold {fold['name']} in BP3 weight bundle of {manifest['model_dir']}.")
+
+
+def bundle_is_current(bundle, model_dir):
+    """
+    True if the fold files in model_dir are still the ones the bundle was packed from. files
+    whose size and mtime match the manifest are taken as unchanged, the others are re-hashed
+    against file_sha256. a model directory without fold files (only the bundle shipped) counts
+    as current.
+    """
+    model_states = sorted(Path(model_dir).glob("*Fold*"))
+    if not model_states:
+        return True
+    folds = bundle["manifest"]["folds"]
+    if [model_state.name for model_state in model_states] != [fold["file"] for fold in folds]:
+        return False
+    for model_state, fold in zip(model_states, folds):
+        stat = model_state.stat()
+        if stat.st_size == fold.get("size") and stat.st_mtime_ns == fold.get("mtime_ns"):
+            continue
+        if file_checksum(model_state) != fold["file_sha256"]:
+            return False
+    return True
+
+
+def load_weight_bundle(path, verify=False):
+    """
+    memory maps a bundle written by pack_weight_bundle. the result is cached per process
+    until the file changes. verify=True also re-hashes every tensor against the manifest,
+    which reads the whole file instead of only mapping it (pack_weight_bundle already did
+    this once).
+    """
+    path = Path(path)
+    mtime = path.stat().st_mtime
+    cached = _loaded_bundles.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    bundle = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    if verify:
+        verify_weight_bundle(bundle)
+    _loaded_bundles[path] = (mtime, bundle)
+    return bundle
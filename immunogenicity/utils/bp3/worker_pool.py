@@ -0,0 +1,50 @@
+import multiprocessing
+import torch
+
+from immunogenicity.utils.bp3.esm_registry import get_esm2_model
+from immunogenicity.utils.cores import available_cores
+
+"""
+multi-process execution for the B-cell epitope stage. the parent process loads ESM-2
+through the registry, moves the weights into shared memory and then forks the workers,
+so every worker finds the model already in its (inherited) registry and all of them map
+the same physical pages instead of each holding a 2.5 GB copy.
+"""
+
+
+def threads_per_worker(jobs):
+    #split the cores between workers so torch intra-op pools don't oversubscribe the node
+    return max(1, available_cores() // jobs)
+
+
+def _init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def _run_task(args):
+    fn, task, kwargs = args
+    return fn(task, **kwargs)
+
+
+def run_with_shared_esm(fn, tasks, jobs, fn_kwargs=None, run_esm_model_local=None, precision="fp32", num_threads=None):
+    """
+    calls fn(task, **fn_kwargs) for every task across jobs forked workers sharing one ESM-2
+    model, results come back in task order. fn has to be a module level function and
+    run_esm_model_local/precision have to match the model fn will ask the registry for.
+    """
+    fn_kwargs = fn_kwargs or {}
+    if "fork" not in multiprocessing.get_all_start_methods():
+        raise RuntimeError("run_with_shared_esm needs the fork start method, which this platform does not support.")
+
+    model, _ = get_esm2_model(run_esm_model_local, precision=precision)
+    if precision != "int8":
+        #shared memory pages survive refcount writes in the children, plain copy-on-write pages may not
+        model.share_memory()
+
+    if num_threads is None:
+        num_threads = threads_per_worker(jobs)
+    print(f"Starting {jobs} B-cell epitope workers with {num_threads} torch thread(s) each")
+
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(jobs, initializer=_init_worker, initargs=(num_threads,)) as pool:
+        return pool.map(_run_task, [(fn, task, fn_kwargs) for task in tasks], chunksize=1)
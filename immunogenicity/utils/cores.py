@@ -0,0 +1,11 @@
+import os
+
+
+def available_cores():
+    """
+    cores this process may run on, the affinity mask is narrower than cpu_count under
+    taskset or a container cpuset
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
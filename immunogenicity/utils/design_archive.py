@@ -0,0 +1,37 @@
+import os
+import tarfile
+import zipfile
+
+"""
+design PDBs straight out of tar (plain or compressed) and zip archives, without extracting
+them. members are streamed one after the other into the sequence reader, a .tar.gz is read in
+a single sequential pass.
+"""
+
+
+def is_archive(path):
+    return os.path.isfile(path) and (tarfile.is_tarfile(path) or zipfile.is_zipfile(path))
+
+
+PDB_SUFFIXES = (".pdb", ".pdb.gz")
+
+
+def iter_archive_pdbs(archive, suffix=PDB_SUFFIXES):
+    """
+    yields (member name, binary stream) for every member of archive whose name ends with
+    suffix (a string or a tuple of them, .pdb and .pdb.gz by default), in archive order.
+    gzipped members are yielded as they are, the PDB reader unzips them.
+    each stream is only valid until the next member is yielded.
+    """
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.endswith(suffix):
+                    with zf.open(info) as stream:
+                        yield info.filename, stream
+    else:
+        #stream mode, members are read in order without seeking back through the compression
+        with tarfile.open(archive, "r|*") as tf:
+            for member in tf:
+                if member.isfile() and member.name.endswith(suffix):
+                    yield member.name, tf.extractfile(member)
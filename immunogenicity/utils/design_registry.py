@@ -0,0 +1,162 @@
+import glob
+import os
+
+from immunogenicity.utils.pdb_reader import read_chain_sequences, read_sequence, first_model_sequence
+from immunogenicity.utils.design_archive import is_archive, iter_archive_pdbs
+from immunogenicity.utils.sequence_table import is_sequence_table, iter_sequence_chunks, DEFAULT_CHUNK_SIZE
+
+"""
+parse-once view of a results directory. the registry globs designability_eval/designs/*.pdb
+once and reads every design's chains once, the eval_* entry points (and protparam.eval) take
+it in place of results_dir so a full functional evaluation doesn't re-parse the designs for
+every evaluator. the designs can also come from a tar/zip archive, read without extracting it.
+"""
+
+
+def design_name(path):
+    """
+    design name of a PDB path, its file name without the extension (both of them for a .pdb.gz)
+    """
+    name = os.path.basename(path)
+    if name.endswith(".gz"):
+        name = name[:-len(".gz")]
+    return os.path.splitext(name)[0]
+
+
+def design_files(source):
+    """
+    the *.pdb files of a designs directory in file name order
+    """
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Designs {source} do not exist.")
+    return sorted(glob.glob(os.path.join(source, '*.pdb')))
+
+
+def designs_source(results_dir, designs=None):
+    return designs if designs is not None else os.path.join(results_dir, 'designability_eval', 'designs')
+
+
+class Design():
+    def __init__(self, path, stream=None):
+        """
+        Inputs:
+            path: PDB file, for archive members <archive>/<member name>
+            stream: open binary stream of the PDB to read instead of path, e.g. an archive member
+        """
+        self.path = path
+        self.name = design_name(path)
+        #every chain of every model, in file order
+        self.chains = read_chain_sequences(stream if stream is not None else path, first_model_only=False)
+        #what pdb_to_sequence returns: all chains and models concatenated in file order
+        self.sequence = "".join(chain.sequence for chain in self.chains)
+        #what protparam reads: first model, chains in chain id order
+        self.first_model_sequence = first_model_sequence(self.chains)
+        self.num_models = len({chain.model for chain in self.chains})
+        self.num_residues = len(self.sequence)
+
+    def __repr__(self):
+        return f"Design({self.name!r}, chains={[chain.chain for chain in self.chains]}, residues={self.num_residues})"
+
+
+class DesignFile():
+    """
+    a design PDB that hasn't been read yet, used wherever a Design is. the sequences are read
+    when they are asked for, e.g. in the pool worker that analyses the design
+    """
+    __slots__ = ("path", "name")
+
+    def __init__(self, path):
+        self.path = path
+        self.name = design_name(path)
+
+    @property
+    def sequence(self):
+        return read_sequence(self.path)
+
+    @property
+    def first_model_sequence(self):
+        return first_model_sequence(read_chain_sequences(self.path, first_model_only=True))
+
+    def __repr__(self):
+        return f"DesignFile({self.name!r})"
+
+
+class DesignRegistry():
+    def __init__(self, results_dir, designs=None):
+        """
+        Inputs:
+            results_dir: results directory, outputs go to its functional_eval
+            designs: directory or tar/tar.gz/zip archive with the design PDBs, defaults to
+                results_dir/designability_eval/designs. every *.pdb and *.pdb.gz member of an
+                archive is a design, named after its file name like in a directory
+        designs are kept in file name order.
+        """
+        self.results_dir = results_dir
+        self.source = designs_source(results_dir, designs)
+        if is_archive(self.source):
+            self.designs = self.read_archive(self.source)
+        else:
+            self.designs = [Design(PDBFile) for PDBFile in design_files(self.source)]
+        self._by_name = {design.name: design for design in self.designs}
+        print(f"Registered {len(self.designs)} designs from {self.source}")
+
+    @staticmethod
+    def read_archive(archive):
+        designs = [Design(os.path.join(archive, member), stream) for member, stream in iter_archive_pdbs(archive)]
+        names = [design.name for design in designs]
+        if len(set(names)) != len(names):
+            duplicate = next(name for name in names if names.count(name) > 1)
+            raise ValueError(f"Design {duplicate} appears more than once in {archive}, design names have to be unique.")
+        #same order as the sorted glob of an extracted designs directory
+        return sorted(designs, key=lambda design: os.path.basename(design.path))
+
+    def __len__(self):
+        return len(self.designs)
+
+    def __iter__(self):
+        return iter(self.designs)
+
+    def __getitem__(self, name):
+        return self._by_name[name]
+
+    @property
+    def names(self):
+        return [design.name for design in self.designs]
+
+    @property
+    def paths(self):
+        return [design.path for design in self.designs]
+
+    @property
+    def sequences(self):
+        return [design.sequence for design in self.designs]
+
+
+def as_registry(results, designs=None):
+    """
+    results_dir or DesignRegistry --> DesignRegistry, for entry points that accept either.
+    designs is passed on to DesignRegistry when a registry has to be built
+    """
+    if isinstance(results, DesignRegistry):
+        return results
+    return DesignRegistry(results, designs)
+
+
+def design_chunks(results, designs=None, chunk_size=DEFAULT_CHUNK_SIZE, parse=True):
+    """
+    results_dir or DesignRegistry (+ designs source) --> (results_dir, iterator over lists of designs).
+    a multi-FASTA/csv/parquet designs source is streamed chunk_size sequences at a time, PDB
+    sources (a registry, a directory or an archive) come as a single chunk.
+    parse=False leaves the PDBs of a designs directory unread, as DesignFiles, for callers that
+    read them in their own workers. archives are always read here, their members can only be
+    streamed in order
+    """
+    if not isinstance(results, DesignRegistry) and is_sequence_table(designs):
+        print(f"Streaming sequences from {designs} in chunks of {chunk_size}")
+        return results, iter_sequence_chunks(designs, chunk_size)
+    if not parse and not isinstance(results, DesignRegistry):
+        source = designs_source(results, designs)
+        if not is_archive(source):
+            return results, iter([[DesignFile(PDBFile) for PDBFile in design_files(source)]])
+    registry = as_registry(results, designs)
+    return registry.results_dir, iter([list(registry)])
@@ -0,0 +1,106 @@
+import gzip
+import io
+from collections import namedtuple
+
+"""
+streaming PDB sequence reader. the evaluators only need one letter sequences, so instead of
+building a Bio.PDB structure this reads the residue name, chain and residue number columns of
+the ATOM/HETATM records in a single pass over the file. a new residue starts whenever chain,
+residue number or insertion code change from one atom record to the next, same as PDBParser.
+"""
+
+THREE_TO_ONE = {"ALA": "A", "CYS": "C", "ASP": "D", "GLU": "E", "PHE": "F",
+                "GLY": "G", "HIS": "H", "ILE": "I", "LYS": "K", "LEU": "L",
+                "MET": "M", "ASN": "N", "PRO": "P", "GLN": "Q", "ARG": "R",
+                "SER": "S", "THR": "T", "VAL": "V", "TRP": "W", "TYR": "Y"}
+
+#residue name field as it appears in the record, e.g. b"ALA" --> b"A"
+_RESNAME_TO_ONE = {three.encode(): one.encode() for three, one in THREE_TO_ONE.items()}
+
+ChainSequence = namedtuple("ChainSequence", ["model", "chain", "sequence", "residue_numbers"])
+
+
+def open_pdb(pdb_file):
+    """
+    opens a PDB for binary reading, gzipped files are recognized by their magic bytes.
+    pdb_file can also be an already open binary stream, e.g. an archive member, which is then
+    read (and closed) in place
+    """
+    if not hasattr(pdb_file, "read"):
+        f = open(pdb_file, "rb")
+        if f.peek(2)[:2] == b"\x1f\x8b":
+            f.close()
+            return gzip.open(pdb_file, "rb")
+        return f
+
+    f = pdb_file if hasattr(pdb_file, "peek") else io.BufferedReader(pdb_file)
+    if f.peek(2)[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    return f
+
+
+def read_chain_sequences(pdb_file, first_model_only=True, hetatm=True):
+    """
+    Inputs:
+        pdb_file: path to a .pdb or gzipped .pdb(.gz), or a binary stream of one
+        first_model_only: stop reading at the end of the first MODEL
+        hetatm: also read HETATM records, which is how modified or ligand-bound amino acids
+            are often written. only the 20 standard amino acids make it into the sequence,
+            waters, ligands and other residues are skipped either way
+    returns a list of ChainSequence(model, chain, sequence, residue_numbers), one per chain and
+    model in the order they first appear in the file. models are numbered from 0 like PDBParser's.
+    """
+    records = (b"ATOM  ", b"HETATM") if hetatm else (b"ATOM  ",)
+    chains = list()
+    #chain id --> (residues, residue numbers) of the current model
+    current = dict()
+    model = 0
+    previous = None
+
+    def close_model():
+        for chain_id, (residues, numbers) in current.items():
+            if residues:
+                chains.append(ChainSequence(model, chain_id, b"".join(residues).decode(), numbers))
+        current.clear()
+
+    with open_pdb(pdb_file) as f:
+        for line in f:
+            record = line[:6]
+            if record in records:
+                #chain id, residue number and insertion code, columns 22-27
+                key = line[21:27]
+                if key == previous:
+                    continue
+                previous = key
+                one = _RESNAME_TO_ONE.get(line[17:20])
+                if one is None:
+                    continue
+                chain_id = line[21:22].decode()
+                residues, numbers = current.setdefault(chain_id, ([], []))
+                residues.append(one)
+                numbers.append(int(line[22:26]))
+            elif record == b"ENDMDL":
+                close_model()
+                if first_model_only:
+                    break
+                model += 1
+                previous = None
+    close_model()
+    return chains
+
+
+def read_sequence(pdb_file, first_model_only=False, hetatm=True):
+    """
+    one letter sequence of all chains (and models) of a PDB, concatenated in file order
+    """
+    return "".join(chain.sequence for chain in read_chain_sequences(pdb_file, first_model_only, hetatm))
+
+
+def first_model_sequence(chains):
+    """
+    sequence of the first model's chains in chain id order. gaps in the residue numbering are
+    not filled in: SeqIO's 'pdb-atom' parser gives "KLWDXVGAS" for a chain missing residue 5,
+    this gives "KLWDVGAS" like PDBParser
+    """
+    first_model = [chain for chain in chains if chain.model == 0]
+    return "".join(chain.sequence for chain in sorted(first_model, key=lambda chain: chain.chain))
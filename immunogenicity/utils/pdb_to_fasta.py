@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import os, sys
-from Bio import PDB, SeqIO
 
 
 def save_fasta(fasta_str, filename="test_sequence.fasta"):
@@ -16,21 +15,14 @@ def save_fasta(fasta_str, filename="test_sequence.fasta"):
 def get_pdb_name(fpath): 
     return os.path.splitext(os.path.basename(fpath))[0]
 
-def pdb_to_fasta(pdb_file, *args): 
-
-    parser = PDB.PDBParser(QUIET=True)
-    structure = parser.get_structure("protein", pdb_file)
+def pdb_to_fasta(pdb_file, *args, first_model_only=False): 
+    from immunogenicity.utils.pdb_reader import read_chain_sequences
 
     fasta_string = ""
-    
-    # Iterate through the structure to extract chains and sequences
-    for model in structure:
-        for chain in model:
-            # Extract the sequence from the chain, exclude water molecules if generated
-            seq = ','.join([res.get_resname() for res in chain if res.get_resname() != 'HOH'])            
-            seq_1letter = ''.join(PDB.Polypeptide.index_to_one(PDB.Polypeptide.three_to_index(c)) for c in seq.split(","))
-            
-            fasta_string += f">{get_pdb_name(pdb_file)}_{chain.get_id()}\n{seq_1letter}\n"
+
+    # one record per chain (and model), waters and other non amino acid residues are skipped
+    for chain in read_chain_sequences(pdb_file, first_model_only=first_model_only):
+        fasta_string += f">{get_pdb_name(pdb_file)}_{chain.chain}\n{chain.sequence}\n"
 
     return fasta_string
             
@@ -1,27 +1,14 @@
 #!/usr/bin/env python
 
-from Bio import PDB
+from immunogenicity.utils.pdb_reader import read_sequence
 
-def pdb_to_sequence(pdb_file, *args):
+def pdb_to_sequence(pdb_file, *args, first_model_only=False):
     """
     take in a pdb file and output a string of one letter AA codes
     irrespective of chain for use in immunogenicity predictions
     """
-    parser = PDB.PDBParser(QUIET=True)
-    structure = parser.get_structure("seq_to_struct", pdb_file)
-    amino_acids = []
-
-    # Iterate over the residues in the structure
-    for model in structure:
-        for chain in model:
-            for residue in chain:
-                if PDB.is_aa(residue):
-                    amino_acids.append(residue.get_resname())
-
-    #there is, in fact a three to one conversion, but is in a release that is not on conda-forge
-    one_letter_codes = [PDB.Polypeptide.index_to_one(PDB.Polypeptide.three_to_index(res)) for res in amino_acids]
-
-    return "".join(one_letter_codes)
+    #single streaming pass over the ATOM/HETATM records, no Bio.PDB structure needed for a sequence
+    return read_sequence(pdb_file, first_model_only=first_model_only)
 
 if __name__ == "__main__": 
     # Example usage
@@ -0,0 +1,144 @@
+import gzip
+import os
+
+"""
+sequence-only design sources: a multi-FASTA (optionally gzipped) or a table with id and
+sequence columns (csv, csv.gz or parquet). they are streamed in chunks so millions of
+variants can be screened before folding without holding them all in memory or writing
+PDBs for them.
+"""
+
+FASTA_SUFFIXES = (".fasta", ".fa", ".faa", ".fas")
+CSV_SUFFIXES = (".csv",)
+PARQUET_SUFFIXES = (".parquet", ".pq")
+
+DEFAULT_CHUNK_SIZE = 10000
+
+#characters an id can't keep once it is part of an output file name
+UNSAFE_NAME_CHARACTERS = ("/", "\\", "\0")
+
+
+class SequenceDesign():
+    """
+    a design known only by its sequence, used wherever a DesignRegistry Design is
+    """
+    __slots__ = ("name", "sequence")
+
+    def __init__(self, name, sequence):
+        self.name = name
+        self.sequence = sequence
+
+    @property
+    def first_model_sequence(self):
+        return self.sequence
+
+    @property
+    def path(self):
+        return None
+
+    def __repr__(self):
+        return f"SequenceDesign({self.name!r}, residues={len(self.sequence)})"
+
+
+def safe_design_name(name):
+    """
+    id of a FASTA record or table row --> design name usable in the per design output file
+    names, path separators become _. PDB designs are named after their file names, which are
+    safe already
+    """
+    for c in UNSAFE_NAME_CHARACTERS:
+        name = name.replace(c, "_")
+    return name
+
+
+def _table_format(path):
+    name = str(path).lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(FASTA_SUFFIXES):
+        return "fasta"
+    if name.endswith(CSV_SUFFIXES):
+        return "csv"
+    if name.endswith(PARQUET_SUFFIXES):
+        return "parquet"
+    return None
+
+
+def is_sequence_table(path):
+    return isinstance(path, (str, os.PathLike)) and _table_format(os.fspath(path)) is not None
+
+
+def _iter_fasta(path):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    name = None
+    parts = list()
+    with opener(path, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(">"):
+                if name is not None:
+                    yield name, "".join(parts)
+                #the id is the first word of the header, like SeqIO's record.id
+                name = line[1:].split(maxsplit=1)[0] if len(line) > 1 else ""
+                parts = list()
+            else:
+                parts.append(line)
+    if name is not None:
+        yield name, "".join(parts)
+
+
+def _iter_csv(path, id_column, sequence_column, chunk_size):
+    import pandas as pd
+    for chunk in pd.read_csv(path, usecols=[id_column, sequence_column], chunksize=chunk_size,
+                             dtype={id_column: str, sequence_column: str}):
+        yield from zip(chunk[id_column], chunk[sequence_column])
+
+
+def _iter_parquet(path, id_column, sequence_column, chunk_size):
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=[id_column, sequence_column]):
+        yield from zip(batch.column(id_column).to_pylist(), batch.column(sequence_column).to_pylist())
+
+
+def iter_sequence_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, id_column="id", sequence_column="sequence"):
+    """
+    yields lists of up to chunk_size SequenceDesigns from a multi-FASTA, csv or parquet file,
+    in file order. sequences are upper cased, path separators in ids are replaced by _
+    (safe_design_name), ids have to be unique within the file and every record needs a sequence.
+    path can be a str or a pathlib.Path
+    """
+    path = os.fspath(path)
+    #checked here and not on the first chunk, the reading itself is lazy
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Sequence table {path} does not exist.")
+    table_format = _table_format(path)
+    if table_format == "fasta":
+        records = _iter_fasta(path)
+    elif table_format == "csv":
+        records = _iter_csv(path, id_column, sequence_column, chunk_size)
+    elif table_format == "parquet":
+        records = _iter_parquet(path, id_column, sequence_column, chunk_size)
+    else:
+        raise ValueError(f"Unknown sequence table format for {path}, expected one of {FASTA_SUFFIXES + CSV_SUFFIXES + PARQUET_SUFFIXES} (optionally .gz).")
+    return _iter_chunks(path, records, chunk_size)
+
+
+def _iter_chunks(path, records, chunk_size):
+    seen = set()
+    chunk = list()
+    for row, (name, sequence) in enumerate(records, start=1):
+        name = safe_design_name(str(name))
+        if name in seen:
+            raise ValueError(f"Sequence id {name} appears more than once in {path} (/ and \\ count as _), ids have to be unique.")
+        seen.add(name)
+        #empty csv cells come back as nan, parquet nulls as None
+        if not isinstance(sequence, str) or not sequence.strip():
+            raise ValueError(f"Sequence {name} (row {row}) in {path} has no sequence.")
+        chunk.append(SequenceDesign(name, sequence.strip().upper()))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+from Bio.Data import IUPACData
+from Bio.SeqUtils import ProtParamData
+from Bio.SeqUtils import IsoelectricPoint
+
+"""
+batch ProtParam engine. all sequences of a design library are encoded once into one flat
+integer array (amino acid codes 0-19 in IUPAC order, plus per sequence offsets) and every
+eval column is computed with array operations over the whole library, using the same
+tables and formulas as Bio.SeqUtils.ProtParam so the values match Biopython's.
+"""
+
+AMINO_ACIDS = IUPACData.protein_letters
+NUM_AAS = len(AMINO_ACIDS)
+WATER = 18.0153
+
+#ascii byte --> amino acid code, -1 for anything that is not a standard amino acid
+_CODE_TABLE = np.full(256, -1, dtype=np.int16)
+for _code, _aa in enumerate(AMINO_ACIDS):
+    _CODE_TABLE[ord(_aa)] = _code
+    _CODE_TABLE[ord(_aa.lower())] = _code
+
+
+def scale_vector(scale):
+    """
+    per residue scale dict, e.g. ProtParamData.kd --> array indexed by amino acid code
+    """
+    return np.array([scale[aa] for aa in AMINO_ACIDS], dtype=np.float64)
+
+
+AA_WEIGHTS = scale_vector(IUPACData.protein_weights)
+KYTE_DOOLITTLE = scale_vector(ProtParamData.kd)
+FLEXIBILITY = scale_vector(ProtParamData.Flex)
+#DIWV[a][b] of the dipeptide ab, as a (20, 20) matrix
+DIWV = np.array([[ProtParamData.DIWV[a][b] for b in AMINO_ACIDS] for a in AMINO_ACIDS], dtype=np.float64)
+
+
+class EncodedSequences():
+    def __init__(self, seqs, names=None):
+        """
+        Inputs:
+            seqs: list of amino acid sequences
+            names: optional list of names matching seqs, used in error messages and as table index
+        Raises ValueError for empty sequences or non-standard residues, like Biopython does.
+        """
+        self.names = list(names) if names is not None else list(range(len(seqs)))
+        self.lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+        self.offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(self.lengths)
+
+        raw = np.frombuffer("".join(seqs).encode("ascii", errors="replace"), dtype=np.uint8)
+        codes = _CODE_TABLE[raw]
+        if (self.lengths == 0).any():
+            raise ValueError(f"Empty sequence for {self.names[int(np.argmax(self.lengths == 0))]}.")
+        if (codes < 0).any():
+            pos = int(np.argmax(codes < 0))
+            idx = int(np.searchsorted(self.offsets, pos, side="right")) - 1
+            raise ValueError(f"'{chr(raw[pos])}' in {self.names[idx]} is not a standard amino acid.")
+
+        self.codes = codes.astype(np.int8)
+        #sequence index of every residue
+        self.seq_ids = np.repeat(np.arange(len(seqs)), self.lengths)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def counts(self):
+        """
+        (sequences, 20) amino acid counts
+        """
+        n = len(self)
+        return np.bincount(self.seq_ids * NUM_AAS + self.codes, minlength=n * NUM_AAS).reshape(n, NUM_AAS)
+
+    def residue_sums(self, values):
+        """
+        per sequence sum of a per residue array
+        """
+        return np.bincount(self.seq_ids, weights=values, minlength=len(self))
+
+    def dipeptide_sums(self, matrix):
+        """
+        per sequence sum of matrix[a, b] over every dipeptide ab
+        """
+        #pairs that start at the last residue of a sequence cross into the next one
+        valid = np.ones(len(self.codes) - 1, dtype=bool) if len(self.codes) else np.zeros(0, dtype=bool)
+        valid[self.offsets[1:-1] - 1] = False
+        values = matrix[self.codes[:-1], self.codes[1:]]
+        return np.bincount(self.seq_ids[:-1][valid], weights=values[valid], minlength=len(self))
+
+
+def charge_at_pH(counts, nterm_pKs, cterm_pKs, pH):
+    """
+    net charge of every sequence at every pH, IsoelectricPoint.charge_at_pH broadcast over
+    (sequences, pH). counts are the (sequences, 20) amino acid counts, nterm/cterm_pKs the
+    sequence specific terminal pKs. terms are added in Biopython's order so results are identical.
+    """
+    pH = np.asarray(pH, dtype=np.float64)
+    counts = counts.astype(np.float64)
+    #(sequences, 1) against pH (1, points) or (sequences, 1) for per sequence pH
+    pH = pH[None, :] if pH.ndim == 1 else pH
+    code = AMINO_ACIDS.index
+
+    positive = np.zeros(np.broadcast_shapes(counts[:, :1].shape, pH.shape))
+    for aa, pK in IsoelectricPoint.positive_pKs.items():
+        if aa == "Nterm":
+            positive = positive + 1.0 * (1.0 / (10 ** (pH - nterm_pKs[:, None]) + 1.0))
+        else:
+            positive = positive + counts[:, code(aa), None] * (1.0 / (10 ** (pH - pK) + 1.0))
+
+    negative = np.zeros_like(positive)
+    for aa, pK in IsoelectricPoint.negative_pKs.items():
+        if aa == "Cterm":
+            negative = negative + 1.0 * (1.0 / (10 ** (cterm_pKs[:, None] - pH) + 1.0))
+        else:
+            negative = negative + counts[:, code(aa), None] * (1.0 / (10 ** (pK - pH) + 1.0))
+
+    return positive - negative
+
+
+def terminal_pKs(encoded):
+    """
+    N- and C-terminal pK of every sequence, IsoelectricPoint._update_pKs_tables vectorized
+    """
+    nterm_table = np.full(NUM_AAS, IsoelectricPoint.positive_pKs["Nterm"])
+    for aa, pK in IsoelectricPoint.pKnterminal.items():
+        nterm_table[AMINO_ACIDS.index(aa)] = pK
+    cterm_table = np.full(NUM_AAS, IsoelectricPoint.negative_pKs["Cterm"])
+    for aa, pK in IsoelectricPoint.pKcterminal.items():
+        cterm_table[AMINO_ACIDS.index(aa)] = pK
+    return nterm_table[encoded.codes[encoded.offsets[:-1]]], cterm_table[encoded.codes[encoded.offsets[1:] - 1]]
+
+
+def isoelectric_points(counts, nterm_pKs, cterm_pKs):
+    """
+    IsoelectricPoint.pi for every sequence, the same bisection run on all of them at once
+    """
+    n = len(counts)
+    pH = np.full(n, 7.775)
+    min_ = np.full(n, 4.05)
+    max_ = np.full(n, 12.0)
+    active = np.ones(n, dtype=bool)
+    while True:
+        active = (max_ - min_) > 0.0001
+        if not active.any():
+            return pH
+        charge = charge_at_pH(counts[active], nterm_pKs[active], cterm_pKs[active], pH[active][:, None])[:, 0]
+        positive = charge > 0.0
+        a_min, a_max = min_[active], max_[active]
+        a_min = np.where(positive, pH[active], a_min)
+        a_max = np.where(positive, a_max, pH[active])
+        min_[active] = a_min
+        max_[active] = a_max
+        pH[active] = (a_min + a_max) / 2
+
+
+def flexibility(encoded):
+    """
+    ProteinAnalysis.flexibility of every sequence as a list of arrays. the scores are a
+    weighted sum over windows of 9 residues, done as one convolution over the whole library.
+    """
+    weights = [0.25, 0.4375, 0.625, 0.8125, 1]
+    window_size = 9
+    #Biopython takes the centre from position 5 of the window and scores len - 9 windows
+    kernel = np.zeros(window_size)
+    for j in range(window_size // 2):
+        kernel[j] += weights[j]
+        kernel[window_size - j - 1] += weights[j]
+    kernel[window_size // 2 + 1] += 1.0
+
+    flex = FLEXIBILITY[encoded.codes]
+    if len(flex) < window_size:
+        #no sequence is long enough for a single window
+        return [np.zeros(0) for _ in range(len(encoded))]
+    #correlate: score of the window starting at i
+    scores = np.convolve(flex, kernel[::-1], mode="valid") / 5.25
+    profiles = list()
+    for start, length in zip(encoded.offsets[:-1], encoded.lengths):
+        profiles.append(scores[start:start + max(0, length - window_size)])
+    return profiles
+
+
+def protparam_table(seqs, names=None, pH=(), with_flexibility=True):
+    """
+    Biopython ProtParam values of every sequence as one numeric dataframe, one row per sequence.
+    columns match protparam.make_row: count_amino_acids_<aa>, amino_acids_percent_<aa> (a fraction),
+    molecular_weight, aromaticity, instability_index, flexibility (the list of window scores, like
+    ProteinAnalysis.flexibility), gravy, isoelectric_point, extinction_coeff, extinction_reduced
+    and charge_at_pH_<p> for every p in pH. with_flexibility=False leaves out the flexibility column.
+    """
+    encoded = EncodedSequences(seqs, names)
+    counts = encoded.counts()
+    lengths = encoded.lengths.astype(np.float64)
+
+    columns = dict()
+    for i, aa in enumerate(AMINO_ACIDS):
+        columns['count_amino_acids_' + aa] = counts[:, i]
+    for i, aa in enumerate(AMINO_ACIDS):
+        columns['amino_acids_percent_' + aa] = counts[:, i] / lengths
+
+    columns['molecular_weight'] = encoded.residue_sums(AA_WEIGHTS[encoded.codes]) - (lengths - 1) * WATER
+    columns['aromaticity'] = sum(counts[:, AMINO_ACIDS.index(aa)] * 100 / lengths / 100 for aa in "YWF")
+    columns['instability_index'] = (10.0 / lengths) * encoded.dipeptide_sums(DIWV)
+    if with_flexibility:
+        columns['flexibility'] = [scores.tolist() for scores in flexibility(encoded)]
+    columns['gravy'] = encoded.residue_sums(KYTE_DOOLITTLE[encoded.codes]) / lengths
+
+    nterm_pKs, cterm_pKs = terminal_pKs(encoded)
+    columns['isoelectric_point'] = isoelectric_points(counts, nterm_pKs, cterm_pKs)
+
+    C, W, Y = (counts[:, AMINO_ACIDS.index(aa)] for aa in "CWY")
+    mec_reduced = W * 5500 + Y * 1490
+    #same (mislabelled) column mapping as make_row: extinction_reduced holds the cystine value
+    columns['extinction_coeff'] = mec_reduced
+    columns['extinction_reduced'] = mec_reduced + (C // 2) * 125
+
+    if len(pH) > 0:
+        charges = charge_at_pH(counts, nterm_pKs, cterm_pKs, list(pH))
+        for i, p in enumerate(pH):
+            columns['charge_at_pH_' + str(p)] = charges[:, i]
+
+    return pd.DataFrame(columns, index=encoded.names)
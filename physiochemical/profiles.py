@@ -0,0 +1,129 @@
+"""
+per residue sequence property profiles. every scale is looked up on the encoded library,
+averaged over sliding windows of the flat residue array and written as one long table
+(design, position, residue, one column per profile). window values are assigned to the
+residue in the middle of the window, residues too close to either end get nan.
+"""
+import numpy as np
+import pandas as pd
+from Bio.SeqUtils import IsoelectricPoint
+
+from physiochemical.batch_protparam import EncodedSequences, AMINO_ACIDS, NUM_AAS, KYTE_DOOLITTLE, flexibility
+
+PROFILES = ["kyte_doolittle", "flexibility", "charge"]
+
+
+def side_chain_charges(pH=7.4):
+    """
+    charge of every amino acid's side chain at pH, from the same pKs as Biopython's charge_at_pH
+    """
+    charges = np.zeros(NUM_AAS)
+    for aa, pK in IsoelectricPoint.positive_pKs.items():
+        if aa in AMINO_ACIDS:
+            charges[AMINO_ACIDS.index(aa)] = 1.0 / (10 ** (pH - pK) + 1.0)
+    for aa, pK in IsoelectricPoint.negative_pKs.items():
+        if aa in AMINO_ACIDS:
+            charges[AMINO_ACIDS.index(aa)] = -1.0 / (10 ** (pK - pH) + 1.0)
+    return charges
+
+
+def window_means(encoded, values, window):
+    """
+    mean of values over every window of window residues inside a sequence, as a flat per
+    residue array aligned to the window centres
+    """
+    out = np.full(len(values), np.nan)
+    #windows start at every residue that has window - 1 residues of the same sequence after it
+    starts = np.arange(len(values))
+    ends = np.repeat(encoded.offsets[1:], encoded.lengths)
+    starts = starts[starts + window <= ends]
+    if len(starts) == 0:
+        return out
+    #every window summed on its own (start, end pairs, odd slots are the gaps in between) so a
+    #value doesn't depend on what else is in the library, unlike differences of one global cumsum
+    padded = np.append(values, 0.0)
+    sums = np.add.reduceat(padded, np.column_stack([starts, starts + window]).ravel())[::2]
+    out[starts + window // 2] = sums / window
+    return out
+
+
+def flexibility_profile(encoded):
+    """
+    ProteinAnalysis.flexibility scores placed on the centre residue of their 9 residue window
+    """
+    out = np.full(len(encoded.codes), np.nan)
+    for start, scores in zip(encoded.offsets[:-1], flexibility(encoded)):
+        out[start + 4:start + 4 + len(scores)] = scores
+    return out
+
+
+def sequence_profiles(seqs, names=None, window=9, pH=7.4, profiles=PROFILES):
+    """
+    Inputs:
+        seqs: list of amino acid sequences
+        names: optional design names, defaults to 0..n-1
+        window: window size of the kyte_doolittle and charge profiles (flexibility always uses
+            Biopython's weighted 9 residue window)
+        pH: pH of the charge profile
+        profiles: which of PROFILES to compute
+    returns a long dataframe with one row per residue: design, position (1-based), residue and
+    one float column per profile.
+    """
+    encoded = EncodedSequences(seqs, names)
+    columns = {"design": np.repeat(np.array(encoded.names, dtype=object), encoded.lengths),
+               "position": np.arange(len(encoded.codes)) - np.repeat(encoded.offsets[:-1], encoded.lengths) + 1,
+               "residue": np.array(list(AMINO_ACIDS))[encoded.codes]}
+    for profile in profiles:
+        if profile == "kyte_doolittle":
+            columns[profile] = window_means(encoded, KYTE_DOOLITTLE[encoded.codes], window)
+        elif profile == "flexibility":
+            columns[profile] = flexibility_profile(encoded)
+        elif profile == "charge":
+            columns[profile] = window_means(encoded, side_chain_charges(pH)[encoded.codes], window)
+        else:
+            raise ValueError(f"Unknown profile {profile}, choose from {PROFILES}.")
+    return pd.DataFrame(columns)
+
+
+def write_profiles(path, table):
+    """
+    writes a sequence_profiles table as parquet. without a parquet engine it falls back to a
+    csv next to it. returns the path written.
+    """
+    writer = ProfileWriter(path)
+    writer.write(table)
+    return writer.close()
+
+
+class ProfileWriter():
+    def __init__(self, path):
+        """
+        writes sequence_profiles tables chunk by chunk into one parquet file (or, without a
+        parquet engine, a csv next to it), for design sources streamed in chunks
+        """
+        self.path = str(path)
+        self.writer = None
+        self.csv_header = True
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            self.pa = pyarrow
+        except ImportError:
+            self.pa = None
+            self.path = self.path.rsplit(".", 1)[0] + ".csv"
+            print(f"No parquet engine (pyarrow) installed, writing profiles to {self.path} instead")
+
+    def write(self, table):
+        if self.pa is None:
+            table.to_csv(self.path, index=False, mode="w" if self.csv_header else "a", header=self.csv_header)
+            self.csv_header = False
+            return
+        arrow_table = self.pa.Table.from_pandas(table, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pa.parquet.ParquetWriter(self.path, arrow_table.schema)
+        self.writer.write_table(arrow_table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        return self.path
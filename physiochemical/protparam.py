@@ -1,21 +1,27 @@
-import glob
-
-import pandas as pd
 import sys, os
-from Bio.SeqUtils.ProtParam import ProteinAnalysis
-from Bio import SeqIO
+from immunogenicity.utils.cores import available_cores
+#pandas and Bio are imported where they are used, the module itself should import in milliseconds
 
 def make_row(dict, PDBFile, pH = []):
-    sequence = ""
+    from immunogenicity.utils.design_registry import design_name
+
+    return sequence_row(dict, design_name(PDBFile), read_sequence(PDBFile), pH)
 
-    with open(PDBFile, 'r') as pdb_file:
-        for record in SeqIO.parse(pdb_file, 'pdb-atom'):
-            sequence += str(record.seq)
+def sequence_row(dict, name, sequence, pH = []):
+    """
+    make_row for a sequence that doesn't come from a PDB, the row is stored under name
+    """
+    from Bio.SeqUtils.ProtParam import ProteinAnalysis
 
     analysis = ProteinAnalysis(sequence)
 
     params = {'count_amino_acids_'+a: v for a, v in analysis.count_amino_acids().items()}
-    params.update({'amino_acids_percent_'+a: v for a, v in analysis.get_amino_acids_percent().items()})
+    if hasattr(analysis, 'get_amino_acids_percent'):
+        percent = analysis.get_amino_acids_percent()
+    else:
+        #newer Biopython dropped get_amino_acids_percent, amino_acids_percent is in percent instead of a fraction
+        percent = {a: v / 100 for a, v in analysis.amino_acids_percent.items()}
+    params.update({'amino_acids_percent_'+a: v for a, v in percent.items()})
     params['molecular_weight'] = "%0.2f" % analysis.molecular_weight()
     params['aromaticity'] = "%0.2f" % analysis.aromaticity()
     params['instability_index'] = "%0.2f" % analysis.instability_index()
@@ -28,15 +34,112 @@ def make_row(dict, PDBFile, pH = []):
     if len(pH) > 0:
         for p in pH: 
             params['charge_at_pH_'+str(p)] = analysis.charge_at_pH(p)
-    pdb_name = os.path.basename(PDBFile).strip('.pdb')
-    dict[pdb_name] = params
+    dict[name] = params
     return dict
 
-def eval(dir, pH_list):
+def read_sequence(PDBFile):
+    """
+    sequence of the first model's chains in chain id order, read with the streaming reader.
+    same chains as SeqIO's 'pdb-atom' parser used before, except that gaps in the residue
+    numbering are skipped instead of filled with X
+    """
+    from immunogenicity.utils.pdb_reader import read_chain_sequences, first_model_sequence
+
+    return first_model_sequence(read_chain_sequences(PDBFile, first_model_only=True))
+
+def chunk_table(designs, pH_list, titration = False, profiles = False, flexibility = True):
+    """
+    analyses a chunk of designs (Designs, DesignFiles or SequenceDesigns) and returns their
+    ProtParam table, their titration curves with titration=True and their per residue profiles
+    with profiles=True (else None). rows are named after the designs, DesignFiles are read here.
+    flexibility=False leaves the flexibility column out of the table.
+    runs in the pool workers
+    """
+    from physiochemical.batch_protparam import protparam_table
+    from physiochemical.titration import titration_curves
+    from physiochemical.profiles import sequence_profiles
+
+    names = [design.name for design in designs]
+    seqs = [design.first_model_sequence for design in designs]
+
+    table = protparam_table(seqs, names, pH_list, with_flexibility=flexibility)
+    curves = titration_curves(seqs, names) if titration else None
+    residue_profiles = sequence_profiles(seqs, names) if profiles else None
+    return table, curves, residue_profiles
+
+def eval(dir, pH_list, jobs = 1, chunk_size = None, titration = False, profiles = False, designs = None,
+         table_chunk_size = 100000, flexibility = True):
+    """
+    ProtParam values of every design, computed for the whole library at once by
+    batch_protparam. columns are the same as make_row's, but numeric instead of formatted strings.
+    flexibility holds every design's list of window scores like make_row's, flexibility=False
+    leaves that column out. profiles are off by default, profiles=True also writes per residue
+    kyte_doolittle, flexibility and charge profiles to functional_eval/protparam_profiles.parquet
+    (the same flexibility scores, placed on the window centres).
+    jobs > 1 parses and analyses the designs in chunks across a process pool, rows are always
+    written in design file name order.
+    titration=True also writes charge vs pH curves on titration.PH_GRID (2 to 12 in 0.05 steps)
+    and their grid solved isoelectric points to functional_eval/titration_curves.npz.
+    dir can also be a DesignRegistry, then the designs it already parsed are used as they are.
+    designs reads the design PDBs from another directory or a tar/zip archive instead of
+    dir/designability_eval/designs, or takes sequences straight from a multi-FASTA or a
+    csv/parquet table with id and sequence columns. tables are streamed table_chunk_size
+    sequences at a time and rows are appended to the outputs in file order.
+    """
+    from physiochemical.profiles import ProfileWriter
+    from immunogenicity.utils.design_registry import design_chunks
+
+    #PDBs of a designs directory are left for chunk_table to read, in the pool workers with jobs > 1
+    dir, batches = design_chunks(dir, designs, table_chunk_size, parse=False)
+    csv_path = os.path.join(dir, "functional_eval/protparam.csv")
+    profile_writer = ProfileWriter(os.path.join(dir, "functional_eval/protparam_profiles.parquet")) if profiles else None
+    all_curves = list()
+    first = True
+    pool = None
+
+    try:
+        for batch in batches:
+            if jobs > 1 and len(batch) > 1:
+                if pool is None:
+                    import multiprocessing
+                    #import the analysis stack once here, forked workers inherit it instead of each importing it
+                    import physiochemical.batch_protparam
+                    import immunogenicity.utils.pdb_reader
+                    #sized once for the whole run, a small first batch mustn't cap the later ones
+                    workers = max(1, min(jobs, available_cores()))
+                    pool = multiprocessing.get_context().Pool(workers)
+                #a few chunks per worker so a slow chunk doesn't leave the others idle
+                size = chunk_size or max(1, -(-len(batch) // (4 * workers)))
+                chunks = [batch[i:i + size] for i in range(0, len(batch), size)]
+                print(f"Running protparam on {len(batch)} designs in {len(chunks)} chunks across {workers} processes")
+                #starmap keeps chunk order, so the row order doesn't depend on which worker finishes first
+                results = pool.starmap(chunk_table, [(chunk, pH_list, titration, profiles, flexibility) for chunk in chunks])
+            else:
+                results = [chunk_table(batch, pH_list, titration, profiles, flexibility)]
+
+            for table, curves, residue_profiles in results:
+                table.to_csv(csv_path, mode = 'w' if first else 'a', header = first)
+                first = False
+                if titration:
+                    all_curves.append(curves)
+                if profiles:
+                    profile_writer.write(residue_profiles)
 
-    files =  glob.glob(os.path.join(dir, 'designability_eval', 'designs', '*.pdb'))
-    props_dict = {}
-    for PDBFile in files:
-        props_dict = make_row(props_dict, PDBFile, pH_list)
+        if first:
+            #no designs, still write the (empty) outputs
+            table, curves, residue_profiles = chunk_table([], pH_list, titration, profiles, flexibility)
+            table.to_csv(csv_path)
+            if titration:
+                all_curves.append(curves)
+            if profiles:
+                profile_writer.write(residue_profiles)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if profiles:
+            profile_writer.close()
 
-    pd.DataFrame.from_dict(props_dict, orient = 'index').to_csv(os.path.join(dir, "functional_eval/protparam.csv"))
+    if titration:
+        from physiochemical.titration import concat_titration_curves, save_titration_curves
+        save_titration_curves(os.path.join(dir, "functional_eval/titration_curves.npz"), concat_titration_curves(all_curves))
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from Bio.SeqUtils.ProtParam import ProteinAnalysis
+
+from physiochemical.batch_protparam import EncodedSequences, flexibility, protparam_table
+
+
+def test_flexibility_library_shorter_than_one_window():
+    #8 residues in total, np.convolve "valid" would swap its arguments here
+    profiles = flexibility(EncodedSequences(["ACD", "EFGHI"]))
+    assert [len(profile) for profile in profiles] == [0, 0]
+
+
+def test_flexibility_matches_biopython():
+    seqs = ["ACD", "MKTAYIAKQRQISFVKSHFSRQ", "GGGGGGGGGG"]
+    for seq, profile in zip(seqs, flexibility(EncodedSequences(seqs))):
+        np.testing.assert_allclose(profile, ProteinAnalysis(seq).flexibility(), rtol=0, atol=1e-12)
+
+
+def test_protparam_table_matches_biopython():
+    seqs = ["MKTAYIAKQRQISFVKSHFSRQ", "DDEEWYC", "K"]
+    table = protparam_table(seqs, ["a", "b", "c"], pH=[7.4])
+    for seq, (_, row) in zip(seqs, table.iterrows()):
+        analysis = ProteinAnalysis(seq)
+        assert row["molecular_weight"] == pytest.approx(analysis.molecular_weight(), abs=1e-9)
+        assert row["instability_index"] == pytest.approx(analysis.instability_index(), abs=1e-9)
+        assert row["isoelectric_point"] == analysis.isoelectric_point()
+        assert row["charge_at_pH_7.4"] == analysis.charge_at_pH(7.4)
+        np.testing.assert_allclose(row["flexibility"], analysis.flexibility(), rtol=0, atol=1e-12)
+    assert "flexibility" not in protparam_table(seqs, pH=[7.4], with_flexibility=False).columns
+
+
+def test_non_standard_residue_raises():
+    with pytest.raises(ValueError):
+        protparam_table(["ACDX"], ["bad"])
@@ -0,0 +1,32 @@
+import pytest
+import torch
+
+from immunogenicity.utils.bp3.bepipred3 import BP3FoldEnsemble, MyDenseNet, MyDenseNetWithSeqLen
+
+
+def random_folds(architecture, num_folds=5):
+    state_dicts = list()
+    for fold in range(num_folds):
+        torch.manual_seed(fold)
+        state_dicts.append(architecture().state_dict())
+    return state_dicts
+
+
+@pytest.mark.parametrize("architecture", [MyDenseNet, MyDenseNetWithSeqLen])
+def test_fused_ensemble_matches_per_fold_models(architecture):
+    state_dicts = random_folds(architecture)
+    ensemble = BP3FoldEnsemble(architecture(), state_dicts).eval()
+    torch.manual_seed(42)
+    antigen = torch.randn(1, 57, architecture().esm_embedding_size)
+
+    with torch.no_grad():
+        fused = ensemble.predict_probs(antigen)
+        per_fold = list()
+        for state_dict in state_dicts:
+            model = architecture()
+            model.load_state_dict(state_dict)
+            model.eval()
+            per_fold.append(torch.softmax(model(antigen), dim=1)[:, 1])
+
+    assert fused.shape == (len(state_dicts), 57)
+    torch.testing.assert_close(fused, torch.stack(per_fold), rtol=0, atol=1e-6)
@@ -0,0 +1,65 @@
+import numpy as np
+import torch
+
+from immunogenicity.utils.bp3 import postprocess
+
+THRESHOLDS = [0.2326530612244898, 0.15510204081632653, 0.1163265306122449, 0.15510204081632653, 0.19387755102040816]
+
+
+def random_fold_probs(num_residues, seed=0, num_folds=5):
+    torch.manual_seed(seed)
+    return [torch.rand(num_residues) * 0.4 for _ in range(num_folds)]
+
+
+def loop_scores(ensemble_prob, seq, rolling_window_size=9, top_pred_pct=0.3, var_threshold=0.1512):
+    """
+    the per residue python loops the BP3 writers used before postprocess
+    """
+    num_residues = len(seq)
+    avg_prob = torch.mean(torch.stack(ensemble_prob, axis=1), axis=1)
+    rolling = np.convolve(avg_prob.numpy(), np.ones(rolling_window_size), 'same') / rolling_window_size
+    #the writers only ever printed the first len(avg_prob) values, 'same' gives more for short antigens
+    rolling = rolling[:len(avg_prob)]
+    nr_top_cands = round(num_residues*top_pred_pct)
+    top_preds = [idx for idx, _ in sorted(enumerate(avg_prob), key=lambda pair: pair[1], reverse=True)][:nr_top_cands]
+    top_string = "".join(seq[i].upper() if i in top_preds else seq[i].lower() for i in range(len(avg_prob)))
+    all_model_preds = [[1 if res >= threshold else 0 for res in probs] for probs, threshold in zip(ensemble_prob, THRESHOLDS)]
+    all_model_preds = np.asarray(all_model_preds)
+    majority_vote = [np.argmax(np.bincount(all_model_preds[:, i])) for i in range(len(avg_prob))]
+    variable_threshold = [1 if res >= var_threshold else 0 for res in avg_prob]
+    return avg_prob.numpy(), rolling, top_string, majority_vote, variable_threshold
+
+
+def test_vectorized_scores_match_the_loops():
+    rng = np.random.default_rng(0)
+    for seed, num_residues in enumerate([1, 8, 9, 60, 301]):
+        seq = "".join(rng.choice(list("ACDEFGHIKLMNPQRSTVWY"), num_residues))
+        ensemble_prob = random_fold_probs(num_residues, seed)
+        avg_prob, rolling, top_string, majority_vote, variable_threshold = loop_scores(ensemble_prob, seq)
+
+        scores = postprocess.bp3_scores(ensemble_prob, num_residues, THRESHOLDS)
+        np.testing.assert_array_equal(scores.avg_prob, avg_prob)
+        np.testing.assert_allclose(scores.rolling_mean, rolling, rtol=0, atol=1e-12)
+        assert postprocess.epitope_string(seq, scores.top_pct_mask) == top_string
+        assert scores.majority_vote.tolist() == majority_vote
+        assert scores.variable_threshold_pred.tolist() == variable_threshold
+
+
+def test_ensemble_buffer_matches_stacked_tensors():
+    fold_probs = [torch.stack(random_fold_probs(n, seed)) for seed, n in enumerate([5, 40, 1])]
+    probs = postprocess.EnsembleProbs(fold_probs)
+    assert probs.lengths().tolist() == [5, 40, 1]
+    for idx, stacked in enumerate(fold_probs):
+        np.testing.assert_array_equal(probs[idx], stacked.numpy())
+        np.testing.assert_array_equal(probs.avg(idx), torch.mean(torch.stack(list(stacked), axis=1), axis=1).numpy())
+
+
+def test_epitope_strings_at_thresholds():
+    rng = np.random.default_rng(1)
+    seq = "".join(rng.choice(list("ACDEFGHIKLMNPQRSTVWY"), 80))
+    scores = rng.random(80)
+    thresholds = np.linspace(0, 1, 101).tolist()
+    expected = ["".join(res.upper() if p >= t else res.lower() for res, p in zip(seq, scores)) for t in thresholds]
+    assert list(postprocess.epitope_strings_at_thresholds(seq, scores, thresholds)) == expected
+    kept = postprocess.threshold_change_points(scores, thresholds)
+    assert len(set(expected)) == len(kept)
@@ -0,0 +1,59 @@
+import pytest
+import torch
+
+esm = pytest.importorskip("esm")
+
+from immunogenicity.utils.bp3 import esm_registry
+from immunogenicity.utils.bp3.bepipred3 import Antigens
+
+
+class PositionESM(torch.nn.Module):
+    """
+    stand-in for ESM-2: every token's representation is its token id, followed by its
+    position in the (windowed) input, so the source window of a residue can be read back
+    """
+    def forward(self, tokens, repr_layers=()):
+        positions = torch.arange(tokens.size(1), dtype=torch.float32).expand(tokens.shape)
+        representation = torch.zeros(*tokens.shape, 1280)
+        representation[..., 0] = tokens.float()
+        representation[..., 1] = positions
+        return {"representations": {33: representation}}
+
+
+@pytest.fixture
+def position_esm(monkeypatch):
+    alphabet = esm.data.Alphabet.from_architecture("ESM-1b")
+    monkeypatch.setitem(esm_registry._loaded_models, (esm_registry.DEFAULT_ESM_MODEL, "fp32"), (PositionESM(), alphabet))
+    return alphabet
+
+
+def encode(seqs, **kwargs):
+    return Antigens(seqs, None, [f"design_{i}" for i in range(len(seqs))], **kwargs)
+
+
+def test_windows_tile_the_sequence():
+    antigens = encode([], esm_window_size=100, esm_window_overlap=30)
+    for seq_len in [1, 100, 101, 170, 171, 1000]:
+        windows = antigens.esm_windows(seq_len)
+        assert windows[0][2] == 0 and windows[-1][3] == seq_len
+        for (start, end, keep_start, keep_end), following in zip(windows, windows[1:] + [None]):
+            assert 0 <= start <= keep_start < keep_end <= end <= seq_len
+            assert end - start <= 100
+            if following is not None:
+                assert keep_end == following[2]
+                assert end - following[0] >= 30
+
+
+def test_stitched_encoding(position_esm):
+    seqs = ["ACDEFGHIKLMNPQRSTVWY" * 13 + "ACD", "MKTAYIAKQR"]
+    full = encode(seqs)
+    windowed = encode(seqs, esm_window_size=64, esm_window_overlap=16)
+    for idx, seq in enumerate(seqs):
+        stitched = windowed.get_esm_encoding(idx)
+        assert stitched.shape == (len(seq), 1280)
+        #same tokens in the same order as the single pass encoding
+        torch.testing.assert_close(stitched[:, 0], full.get_esm_encoding(idx)[:, 0])
+        #every residue comes from the window whose keep range holds it, at its place in that window
+        for start, end, keep_start, keep_end in windowed.esm_windows(len(seq)):
+            positions = stitched[keep_start:keep_end, 1]
+            torch.testing.assert_close(positions, torch.arange(keep_start - start, keep_end - start, dtype=torch.float32) + 1)
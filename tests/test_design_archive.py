@@ -0,0 +1,51 @@
+import gzip
+import tarfile
+import zipfile
+
+import pytest
+
+from immunogenicity.utils.design_archive import iter_archive_pdbs
+from immunogenicity.utils.design_registry import DesignRegistry, design_name
+from test_pdb_reader import write_pdb
+
+SEQUENCES = {"plain": "KLWDVGAS", "zipped": "MKTAYIAKQR"}
+
+
+@pytest.fixture
+def members(tmp_path):
+    pdbs = tmp_path / "pdbs"
+    pdbs.mkdir()
+    write_pdb(pdbs / "plain.pdb", {"A": list(enumerate(SEQUENCES["plain"], start=1))})
+    write_pdb(pdbs / "zipped.pdb", {"A": list(enumerate(SEQUENCES["zipped"], start=1))})
+    (pdbs / "zipped.pdb.gz").write_bytes(gzip.compress((pdbs / "zipped.pdb").read_bytes()))
+    (pdbs / "notes.txt").write_text("not a design\n")
+    return [pdbs / "zipped.pdb.gz", pdbs / "plain.pdb", pdbs / "notes.txt"]
+
+
+def write_tar(path, members):
+    with tarfile.open(path, "w:gz") as tf:
+        for member in members:
+            tf.add(member, arcname=f"designs/{member.name}")
+    return path
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, "w") as zf:
+        for member in members:
+            zf.write(member, arcname=f"designs/{member.name}")
+    return path
+
+
+def test_design_name_strips_gz():
+    assert design_name("/a/design_1.pdb.gz") == "design_1"
+    assert design_name("/a/design_1.pdb") == "design_1"
+
+
+@pytest.mark.parametrize("write_archive", [write_tar, write_zip])
+def test_gzipped_members_are_designs(tmp_path, members, write_archive):
+    archive = write_archive(tmp_path / "designs.archive", members)
+    assert [name for name, _ in iter_archive_pdbs(archive)] == ["designs/zipped.pdb.gz", "designs/plain.pdb"]
+
+    registry = DesignRegistry(str(tmp_path), designs=str(archive))
+    assert registry.names == ["plain", "zipped"]
+    assert registry.sequences == [SEQUENCES["plain"], SEQUENCES["zipped"]]
@@ -0,0 +1,20 @@
+import torch
+
+from immunogenicity.utils.bp3.esm_cache import ESMEmbeddingCache
+
+
+def test_processes_sharing_a_cache_stay_under_max_bytes(tmp_path):
+    entry = torch.zeros(10, 8)
+    first = ESMEmbeddingCache(tmp_path, "esm")
+    first.put("A", entry)
+    entry_bytes = first.size_bytes()
+
+    #two processes writing into one directory, each only counting its own puts used to let it
+    #grow to about twice max_bytes
+    max_bytes = 10 * entry_bytes
+    caches = [ESMEmbeddingCache(tmp_path, "esm", max_bytes=max_bytes) for _ in range(2)]
+    for i in range(40):
+        caches[i % 2].put(f"SEQ{i}", entry)
+        assert caches[0].size_bytes() <= max_bytes
+    assert sum(cache.evictions for cache in caches) > 0
+    torch.testing.assert_close(caches[0].get("SEQ39"), entry)
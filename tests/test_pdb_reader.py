@@ -0,0 +1,47 @@
+import warnings
+
+from Bio import PDB, SeqIO
+
+from immunogenicity.utils.pdb_reader import THREE_TO_ONE, read_chain_sequences, read_sequence, first_model_sequence
+
+ONE_TO_THREE = {one: three for three, one in THREE_TO_ONE.items()}
+
+
+def write_pdb(path, chains):
+    """
+    chains: {chain id: [(residue number, one letter code), ...]}, CA atoms only
+    """
+    lines = list()
+    serial = 1
+    for chain_id, residues in chains.items():
+        for number, one in residues:
+            lines.append("ATOM  %5d  CA  %3s %s%4d    %8.3f%8.3f%8.3f  1.00  0.00           C"
+                         % (serial, ONE_TO_THREE[one], chain_id, number, serial * 3.8, 0.0, 0.0))
+            serial += 1
+        lines.append("TER")
+    lines.append("END")
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_gapped_chain(tmp_path):
+    #residue 5 is missing
+    pdb_file = write_pdb(tmp_path / "gapped.pdb", {"A": list(zip([1, 2, 3, 4, 6, 7, 8, 9], "KLWDVGAS"))})
+    chains = read_chain_sequences(pdb_file)
+    assert [(chain.chain, chain.sequence) for chain in chains] == [("A", "KLWDVGAS")]
+    assert chains[0].residue_numbers == [1, 2, 3, 4, 6, 7, 8, 9]
+    assert first_model_sequence(chains) == "KLWDVGAS"
+
+    structure = PDB.PDBParser(QUIET=True).get_structure("gapped", str(pdb_file))
+    assert read_sequence(pdb_file) == "".join(THREE_TO_ONE[residue.get_resname()] for residue in structure.get_residues())
+    #SeqIO fills the gap, which the reader deliberately doesn't
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        assert str(next(SeqIO.parse(str(pdb_file), "pdb-atom")).seq) == "KLWDXVGAS"
+
+
+def test_chains_in_id_order(tmp_path):
+    pdb_file = write_pdb(tmp_path / "two_chains.pdb", {"B": list(zip(range(1, 4), "GAS")), "A": list(zip(range(1, 4), "KLW"))})
+    chains = read_chain_sequences(pdb_file)
+    assert read_sequence(pdb_file) == "GASKLW"
+    assert first_model_sequence(chains) == "KLWGAS"
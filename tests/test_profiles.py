@@ -0,0 +1,34 @@
+import random
+
+import numpy as np
+
+from physiochemical.batch_protparam import KYTE_DOOLITTLE, EncodedSequences
+from physiochemical.profiles import sequence_profiles, window_means
+
+
+def random_library(n, seed=0):
+    rng = random.Random(seed)
+    return ["".join(rng.choice("ACDEFGHIKLMNPQRSTVWY") for _ in range(rng.randint(1, 300))) for _ in range(n)]
+
+
+def test_window_means_match_plain_means():
+    seqs = ["ACDEFGHIKLMNPQ", "WY", "KKKKKKKKKKKKK"]
+    encoded = EncodedSequences(seqs)
+    values = KYTE_DOOLITTLE[encoded.codes]
+    out = window_means(encoded, values, 5)
+    for seq, start, end in zip(seqs, encoded.offsets[:-1], encoded.offsets[1:]):
+        expected = np.full(len(seq), np.nan)
+        for i in range(len(seq) - 4):
+            expected[i + 2] = np.mean(values[start + i:start + i + 5])
+        np.testing.assert_allclose(out[start:end], expected, rtol=0, atol=1e-12)
+
+
+def test_profiles_do_not_depend_on_the_rest_of_the_library():
+    seqs = random_library(200)
+    library = sequence_profiles(seqs)
+    for i in (0, 57, 199):
+        alone = sequence_profiles(seqs[i:i + 1], names=[i])
+        in_library = library[library["design"] == i].reset_index(drop=True)
+        #bit for bit, so chunking and job count can't change the output
+        for column in ["position", "residue", "kyte_doolittle", "flexibility", "charge"]:
+            np.testing.assert_array_equal(in_library[column].to_numpy(), alone[column].to_numpy())
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from physiochemical import protparam
+from immunogenicity.utils.design_registry import DesignRegistry, design_chunks
+from test_pdb_reader import write_pdb
+
+
+@pytest.fixture
+def results_dir(tmp_path):
+    designs = tmp_path / "designability_eval" / "designs"
+    designs.mkdir(parents=True)
+    #names made of the letters of ".pdb", which str.strip('.pdb') used to eat
+    for name, seq in [("pdbd", "KLWDVGAS"), ("bp_design", "MKTAYIAKQR"), ("design_1", "ACDEFGHIK")]:
+        write_pdb(designs / f"{name}.pdb", {"A": list(enumerate(seq, start=1))})
+    (tmp_path / "functional_eval").mkdir()
+    return tmp_path
+
+
+def read_table(results_dir):
+    return pd.read_csv(results_dir / "functional_eval" / "protparam.csv", index_col=0)
+
+
+def test_rows_named_after_design_files(results_dir):
+    protparam.eval(str(results_dir), [7.4])
+    table = read_table(results_dir)
+    assert list(table.index) == ["bp_design", "design_1", "pdbd"]
+    #profiles are opt-in, flexibility stays in the table
+    assert "flexibility" in table.columns
+    assert not (results_dir / "functional_eval" / "protparam_profiles.parquet").exists()
+    assert protparam.make_row({}, str(results_dir / "designability_eval" / "designs" / "pdbd.pdb"), [7.4]).keys() == {"pdbd"}
+
+
+def test_directory_and_registry_agree(results_dir):
+    protparam.eval(str(results_dir), [7.4], jobs=2, chunk_size=1)
+    from_directory = read_table(results_dir)
+    protparam.eval(DesignRegistry(str(results_dir)), [7.4])
+    pd.testing.assert_frame_equal(from_directory, read_table(results_dir))
+
+
+def test_unparsed_chunks_read_lazily(results_dir):
+    _, chunks = design_chunks(str(results_dir), parse=False)
+    (chunk,) = list(chunks)
+    assert [design.name for design in chunk] == ["bp_design", "design_1", "pdbd"]
+    assert chunk[2].first_model_sequence == "KLWDVGAS"
+
+
+def test_empty_library_with_profiles(tmp_path):
+    (tmp_path / "designability_eval" / "designs").mkdir(parents=True)
+    (tmp_path / "functional_eval").mkdir()
+    protparam.eval(str(tmp_path), [7.4], titration=True, profiles=True)
+    assert len(read_table(tmp_path)) == 0
+    profiles = pd.read_parquet(tmp_path / "functional_eval" / "protparam_profiles.parquet")
+    assert len(profiles) == 0
+
+
+def test_pool_sized_from_jobs_and_cores(results_dir, monkeypatch, capsys):
+    monkeypatch.setattr(protparam, "available_cores", lambda: 3)
+    #a first batch of two designs used to cap the pool at two processes
+    protparam.eval(str(results_dir), [7.4], jobs=4, table_chunk_size=2)
+    assert "across 3 processes" in capsys.readouterr().out
+    assert len(read_table(results_dir)) == 3
@@ -0,0 +1,55 @@
+import os
+import pathlib
+
+import pytest
+
+from immunogenicity.utils.design_registry import DesignRegistry, design_chunks
+from immunogenicity.utils.sequence_table import is_sequence_table, iter_sequence_chunks
+
+
+def test_path_input(tmp_path):
+    fasta = tmp_path / "library.fasta"
+    fasta.write_text(">a first\nacde\nFG\n>b\nKLM\n")
+    assert is_sequence_table(fasta)
+    results_dir, chunks = design_chunks(str(tmp_path), fasta, chunk_size=1)
+    chunks = list(chunks)
+    assert [[(design.name, design.sequence) for design in chunk] for chunk in chunks] == [[("a", "ACDEFG")], [("b", "KLM")]]
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        iter_sequence_chunks(tmp_path / "missing.fasta")
+    with pytest.raises(FileNotFoundError):
+        design_chunks(str(tmp_path), str(tmp_path / "missing.csv"))
+    with pytest.raises(FileNotFoundError):
+        DesignRegistry(str(tmp_path), pathlib.Path(tmp_path, "no_designs"))
+
+
+def test_null_sequence(tmp_path):
+    table = tmp_path / "library.csv"
+    table.write_text("id,sequence\na,ACDE\nb,\nc,KLM\n")
+    with pytest.raises(ValueError, match=r"Sequence b \(row 2\)"):
+        list(iter_sequence_chunks(table))
+
+
+def test_null_sequence_parquet(tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    table = tmp_path / "library.parquet"
+    pd.DataFrame({"id": ["a", "b"], "sequence": [None, "KLM"]}).to_parquet(table)
+    with pytest.raises(ValueError, match=r"Sequence a \(row 1\)"):
+        list(iter_sequence_chunks(table))
+
+
+def test_ids_are_safe_file_names(tmp_path):
+    fasta = tmp_path / "library.fasta"
+    fasta.write_text(">../../escape\nACDE\n>sp|P1|a\\b\nKLM\n")
+    (chunk,) = list(iter_sequence_chunks(fasta))
+    assert [design.name for design in chunk] == [".._.._escape", "sp|P1|a_b"]
+    for design in chunk:
+        assert os.path.dirname(os.path.join(tmp_path, f"bepipred3_{design.name}.csv")) == str(tmp_path)
+
+    table = tmp_path / "library.csv"
+    table.write_text("id,sequence\na/b,ACDE\na_b,KLM\n")
+    with pytest.raises(ValueError, match="more than once"):
+        list(iter_sequence_chunks(table))
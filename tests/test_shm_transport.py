@@ -0,0 +1,54 @@
+import os
+
+import pytest
+import torch
+
+from immunogenicity.utils.bp3 import shm_transport
+from immunogenicity.utils.bp3.shm_transport import run_two_stage_pipeline
+
+
+def embedding_sum(embedding, task, scale=1.0):
+    return float(embedding.sum()) * scale, task
+
+
+def die_on_third(embedding, task):
+    if task == 3:
+        os._exit(1)
+    return task
+
+
+def fail_on_third(embedding, task):
+    if task == 3:
+        raise ValueError("bad design")
+    return task
+
+
+def produce(n=12):
+    for i in range(n):
+        yield torch.full((50 + i, 8), float(i)), i
+
+
+def shm_segments():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_results_in_production_order():
+    before = shm_segments()
+    results = run_two_stage_pipeline(produce, embedding_sum, 2, consume_kwargs=dict(scale=2.0), max_in_flight=2)
+    assert results == [(2.0 * i * (50 + i) * 8, i) for i in range(12)]
+    assert shm_segments() <= before
+
+
+def test_dead_worker_raises(monkeypatch):
+    monkeypatch.setattr(shm_transport, "POLL_INTERVAL", 0.1)
+    before = shm_segments()
+    with pytest.raises(RuntimeError, match="worker died"):
+        run_two_stage_pipeline(produce, die_on_third, 2, max_in_flight=3)
+    assert shm_segments() <= before
+
+
+def test_worker_exception_is_raised():
+    before = shm_segments()
+    with pytest.raises(ValueError, match="bad design"):
+        run_two_stage_pipeline(produce, fail_on_third, 2, max_in_flight=3)
+    assert shm_segments() <= before
@@ -0,0 +1,47 @@
+import numpy as np
+from Bio.SeqUtils.IsoelectricPoint import IsoelectricPoint
+from Bio.SeqUtils.ProtParam import ProteinAnalysis
+
+from physiochemical.titration import PH_GRID, concat_titration_curves, load_titration_curves, save_titration_curves, titration_curves
+
+SEQS = ["MKTAYIAKQRQISFVKSHFSRQ", "DDEEWYC", "K", "HHHHHHGGGGSSSS", "CCRRKKDDEE"]
+
+
+def test_curves_match_biopython(tmp_path):
+    path = tmp_path / "titration_curves.npz"
+    save_titration_curves(path, titration_curves(SEQS, [f"design_{i}" for i in range(len(SEQS))]))
+    curves = load_titration_curves(path)
+
+    assert curves.names == [f"design_{i}" for i in range(len(SEQS))]
+    np.testing.assert_array_equal(curves.pH, PH_GRID)
+    assert curves.charge.shape == (len(SEQS), len(PH_GRID)) and curves.charge.dtype == np.float32
+    for seq, charge, pI in zip(SEQS, curves.charge, curves.isoelectric_point):
+        biopython = IsoelectricPoint(seq)
+        for i in range(0, len(PH_GRID), 20):
+            #stored as float32
+            assert abs(charge[i] - biopython.charge_at_pH(PH_GRID[i])) <= 1e-5 * max(1.0, abs(charge[i]))
+        expected_pI = ProteinAnalysis(seq).isoelectric_point()
+        #Biopython's bisection doesn't go below pH 4.05, the grid does
+        if expected_pI > 4.06:
+            assert abs(pI - expected_pI) < 1e-2
+        else:
+            assert pI < 4.06
+
+
+def test_custom_grid():
+    pH = [5.0, 7.4, 9.0]
+    curves = titration_curves(SEQS, pH=pH)
+    for seq, charge in zip(SEQS, curves.charge):
+        np.testing.assert_allclose(charge, [IsoelectricPoint(seq).charge_at_pH(p) for p in pH], rtol=1e-6, atol=1e-6)
+
+
+def test_empty_batch(tmp_path):
+    empty = titration_curves([], [])
+    assert empty.charge.shape == (0, len(PH_GRID)) and empty.isoelectric_point.shape == (0,)
+    combined = concat_titration_curves([empty, titration_curves(SEQS[:1], ["a"])])
+    assert combined.names == ["a"] and combined.charge.shape == (1, len(PH_GRID))
+
+    path = tmp_path / "empty.npz"
+    save_titration_curves(path, empty)
+    loaded = load_titration_curves(path)
+    assert loaded.names == [] and loaded.charge.shape == (0, len(PH_GRID))
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+import torch
+
+from immunogenicity.utils.bp3 import weight_bundle
+from immunogenicity.utils.bp3.bepipred3 import CLASSIFICATION_THRESHOLDS, MyDenseNet, load_fold_ensemble
+
+THRESHOLDS = CLASSIFICATION_THRESHOLDS["BP3C50IDFFNN"]
+
+
+def write_folds(model_dir, seed=0):
+    model_dir.mkdir(exist_ok=True)
+    for fold in range(1, 6):
+        torch.manual_seed(seed + fold)
+        torch.save(MyDenseNet().state_dict(), model_dir / f"Fold{fold}.pt")
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    model_dir = tmp_path / "BP3C50IDFFNN"
+    write_folds(model_dir)
+    weight_bundle.pack_weight_bundle(model_dir, THRESHOLDS)
+    return model_dir
+
+
+def fold_probs(model_dir):
+    torch.manual_seed(7)
+    antigen = torch.randn(1, 20, 1280)
+    with torch.no_grad():
+        return load_fold_ensemble(model_dir, MyDenseNet()).module.predict_probs(antigen)
+
+
+def test_bundle_matches_fold_files(model_dir):
+    bundle = weight_bundle.load_weight_bundle(weight_bundle.bundle_path(model_dir))
+    assert weight_bundle.bundle_is_current(bundle, model_dir)
+    packed = fold_probs(model_dir)
+    os.remove(weight_bundle.bundle_path(model_dir))
+    torch.testing.assert_close(packed, fold_probs(model_dir), rtol=0, atol=0)
+
+
+def test_touched_fold_files_keep_the_bundle(model_dir):
+    os.utime(model_dir / "Fold3.pt", ns=(0, 0))
+    bundle = weight_bundle.load_weight_bundle(weight_bundle.bundle_path(model_dir))
+    assert weight_bundle.bundle_is_current(bundle, model_dir)
+
+
+def test_stale_bundle_falls_back_to_fold_files(model_dir):
+    stale = fold_probs(model_dir)
+    write_folds(model_dir, seed=100)
+    bundle = weight_bundle.load_weight_bundle(weight_bundle.bundle_path(model_dir))
+    assert not weight_bundle.bundle_is_current(bundle, model_dir)
+
+    updated = fold_probs(model_dir)
+    assert not torch.allclose(stale, updated)
+    os.rename(weight_bundle.bundle_path(model_dir), model_dir.parent / "old.bundle.pt")
+    torch.testing.assert_close(updated, fold_probs(model_dir), rtol=0, atol=0)
+
+
+def test_tensor_hashes_are_opt_in(model_dir, monkeypatch):
+    path = weight_bundle.bundle_path(model_dir)
+    weight_bundle._loaded_bundles.clear()
+    def fail(state_dict):
+        raise AssertionError("tensors hashed on a default load")
+    monkeypatch.setattr(weight_bundle, "tensors_checksum", fail)
+    weight_bundle.load_weight_bundle(path)
+    monkeypatch.undo()
+    weight_bundle._loaded_bundles.clear()
+    weight_bundle.load_weight_bundle(path, verify=True)